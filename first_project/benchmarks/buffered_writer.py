@@ -0,0 +1,60 @@
+'''Пропускная способность записи: create_record на каждую строку против BufferedWriter, 1 и 64 потока-производителя.
+Запуск из first_project: python -m benchmarks.buffered_writer [число строк]
+Каждый прогон пишет в новый файл SQLite'''
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Integer, String
+
+from db_tools.alternative import AlternativeModelManager
+from db_tools.buffered_writer import BufferedWriter
+
+logging.disable(logging.CRITICAL)
+
+TABLE_NAME = 'events'
+THREADS = (1, 64)
+
+
+def run(directory: str, rows: int, threads: int, buffered: bool) -> float:
+    """Пишет rows строк из threads потоков, возвращает строк в секунду"""
+    path = os.path.join(directory, f"{'buffered' if buffered else 'direct'}_{threads}.db")
+    manager = AlternativeModelManager(f'sqlite:///{path}?timeout=60')  # timeout - ожидание блокировки файла
+    manager.create_model(TABLE_NAME, {'name': String(30), 'value': Integer})
+    per_thread = rows // threads
+    writer = BufferedWriter(manager, TABLE_NAME, max_batch=500, max_delay_ms=20) if buffered else None
+
+    def produce(_):
+        if buffered:
+            return [writer.submit({'name': 'event', 'value': index}) for index in range(per_thread)]
+        for index in range(per_thread):
+            manager.create_record(TABLE_NAME, {'name': 'event', 'value': index})
+        return []
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [future for produced in executor.map(produce, range(threads)) for future in produced]
+    if buffered:
+        writer.close()
+        assert len({future.result() for future in futures}) == per_thread * threads
+    elapsed = time.perf_counter() - started
+    assert manager.aggregate(TABLE_NAME, {'rows': ('count', '*')})['rows'] == per_thread * threads
+    manager.engine.dispose()
+    return per_thread * threads / elapsed
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in THREADS:
+            direct = run(directory, rows, threads, buffered=False)
+            buffered = run(directory, rows, threads, buffered=True)
+            print(f"threads={threads:3d}: create_record {direct:9.0f} rows/s, "
+                  f"BufferedWriter {buffered:9.0f} rows/s ({buffered / direct:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''Память и скорость read_all: ORM-объекты против компактных строк (compact=True).
+Запуск из first_project: python -m benchmarks.compact_rows [число строк] [путь к файлу SQLite]
+Таблица заполняется один раз, при повторных запусках файл переиспользуется'''
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Integer, String
+
+from db_tools.alternative import AlternativeModelManager
+
+logging.disable(logging.CRITICAL)
+
+TABLE_NAME = 'users'
+COLUMNS = {'username': String(50), 'email': String(100), 'age': Integer, 'is_active': Boolean, 'created_at': DateTime}
+FILL_BATCH = 50000
+
+
+def fill(manager: AlternativeModelManager, rows: int) -> None:
+    manager.create_model(TABLE_NAME, COLUMNS)
+    now = datetime.now()
+    for start in range(0, rows, FILL_BATCH):
+        manager.create_records(TABLE_NAME, [
+            {'username': f'u{i}', 'email': f'u{i}@example.com', 'age': i % 90, 'is_active': True, 'created_at': now}
+            for i in range(start, min(rows, start + FILL_BATCH))])
+
+
+def main() -> None:
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = sys.argv[2] if len(sys.argv) > 2 else f'/tmp/compact_rows_{rows_count}.db'
+    manager = AlternativeModelManager(f'sqlite:///{path}')
+    if not os.path.exists(path) or not manager._table_exists(TABLE_NAME):
+        fill(manager, rows_count)
+    for compact in (False, True):
+        manager.read_all(TABLE_NAME, compact=compact)  # прогрев кэша моделей и типов строк
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = manager.read_all(TABLE_NAME, compact=compact)
+        elapsed = time.perf_counter() - started
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        started = time.perf_counter()
+        sum(row.age for row in rows)
+        attr_elapsed = time.perf_counter() - started
+        print(f"compact={compact!s:5}: {len(rows)} rows, read {elapsed:6.2f}s ({len(rows) / elapsed:8.0f} rows/s), "
+              f"retained {retained / 2 ** 20:7.1f} MiB ({retained / len(rows):5.0f} B/row), "
+              f"peak {peak / 2 ** 20:7.1f} MiB, attr sum {attr_elapsed * 1000:6.1f} ms")
+        del rows
+        gc.collect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''Масштабирование run_concurrently по числу потоков и single-flight отражения моделей.
+Запуск из first_project: python -m benchmarks.run_concurrently [задержка запроса, мс]
+На SQLite запросы упираются в CPU и GIL, поэтому задержка сети до сервера БД имитируется
+паузой перед каждым запросом - именно ее и перекрывают параллельные операции'''
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Integer, String, event
+
+from db_tools.alternative import AlternativeModelManager
+
+logging.disable(logging.CRITICAL)
+
+TABLE_NAME = 'users'
+ROWS = 2000
+OPS = 500
+WORKERS = (1, 2, 4, 8, 15)
+
+
+def single_flight(database_url: str) -> None:
+    """32 потока одновременно промахиваются по одной таблице - отражение должно выполниться один раз"""
+    manager = AlternativeModelManager(database_url)
+    reflections = 0
+    reflect = manager._reflect_existing_table
+
+    def counting_reflect(table_name):
+        nonlocal reflections
+        reflections += 1
+        time.sleep(0.05)
+        return reflect(table_name)
+
+    manager._reflect_existing_table = counting_reflect
+    with ThreadPoolExecutor(32) as executor:
+        models = set(executor.map(lambda _: manager._get_model(TABLE_NAME), range(32)))
+    print(f"32 concurrent cache misses -> {reflections} reflection(s), {len(models)} model class(es)")
+
+
+def main() -> None:
+    latency_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'run_concurrently.db')}"
+        manager = AlternativeModelManager(database_url)
+        manager.create_model(TABLE_NAME, {'name': String(30), 'age': Integer})
+        manager.create_records(TABLE_NAME, [{'name': f'u{i}', 'age': i} for i in range(ROWS)])
+        single_flight(database_url)
+
+        @event.listens_for(manager.engine, 'before_cursor_execute')
+        def simulate_latency(*args):
+            time.sleep(latency_ms / 1000)  # имитация round-trip до сервера БД
+
+        ops = [('read', (TABLE_NAME, 1 + i % ROWS), {'compact': True}) for i in range(OPS)]
+        print(f"pool capacity {manager._pool_capacity()}, simulated latency {latency_ms} ms")
+        for workers in WORKERS:
+            started = time.perf_counter()
+            results = manager.run_concurrently(ops, max_workers=workers)
+            elapsed = time.perf_counter() - started
+            assert all(result is not None for result in results)
+            print(f"workers={workers:2d}: {len(ops) / elapsed:7.0f} ops/s")
+        manager.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from db_tools.alternative import OPERATION_KINDS
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(RuntimeError):
+    '''Операция отклонена: бюджет конкурентности исчерпан, а очередь заполнена или ожидание истекло'''
+
+
+class _Budget:
+    '''Бюджет одного типа операций: число одновременно выполняемых и ожидающих + метрики'''
+
+    def __init__(self, kind: str, limit: int, max_queue: int, queue_timeout: float):
+        self.kind = kind
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queued = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    def acquire(self) -> None:
+        with self.condition:
+            if self.in_flight < self.limit and not self.waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(f"'{self.kind}' budget of {self.limit} is exhausted and queue is full")
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                admitted = self.condition.wait_for(lambda: self.in_flight < self.limit, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            queued = time.monotonic() - started
+            self.queued += 1
+            self.queue_time_total += queued
+            self.queue_time_max = max(self.queue_time_max, queued)
+            if not admitted:
+                self.rejected += 1
+                self.timed_out += 1
+                raise AdmissionRejected(f"'{self.kind}' operation waited {queued:.3f}s in queue and was rejected")
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'queued': self.queued,
+                'queue_time_avg_ms': self.queue_time_total / self.queued * 1000 if self.queued else 0.0,
+                'queue_time_max_ms': self.queue_time_max * 1000,
+            }
+
+
+class AdmissionController:
+    '''Ограничитель конкурентности перед менеджерами: отдельные бюджеты для read, write и ddl,
+    чтобы всплеск нагрузки не выбирал весь пул соединений и не копил бесконечную очередь.
+    Типы без лимита пропускаются без ограничений'''
+
+    def __init__(self, limits: Dict[str, int], max_queue: Dict[str, int] = None,
+                 queue_timeout: float = None):
+        """
+        Args:
+            limits: Сколько операций каждого типа выполняется одновременно, например {'read': 20, 'write': 10, 'ddl': 1}
+            max_queue: Сколько операций может ждать своей очереди, 0 (по умолчанию) - сразу отказ (fail-fast)
+            queue_timeout: Максимальное ожидание в очереди в секундах, None - без ограничения
+        """
+        unknown_kinds = (set(limits) | set(max_queue or {})) - set(OPERATION_KINDS)
+        if unknown_kinds:
+            raise ValueError(f"Unknown operation kinds {sorted(unknown_kinds)}, expected {OPERATION_KINDS}")
+        self._budgets = {kind: _Budget(kind, limit, (max_queue or {}).get(kind, 0), queue_timeout)
+                         for kind, limit in limits.items()}
+
+    @contextmanager
+    def admit(self, kind: str) -> Iterator[None]:
+        """Выполняет блок в рамках бюджета kind
+        Raises:
+            AdmissionRejected: Бюджет исчерпан, очередь заполнена или ожидание истекло"""
+        budget = self._budgets.get(kind)
+        if budget is None:
+            yield
+            return
+        try:
+            budget.acquire()
+        except AdmissionRejected as e:
+            logger.warning(str(e))
+            raise
+        try:
+            yield
+        finally:
+            budget.release()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Метрики по типам операций: допущено, отклонено, время в очереди"""
+        return {kind: budget.snapshot() for kind, budget in self._budgets.items()}
@@ -1,12 +1,20 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean, MetaData
+from sqlalchemy import create_engine, func, Column, Integer, BigInteger, Numeric, String, Text, DateTime, Float, Boolean, MetaData, Table, Computed, Index, text, and_, or_, insert, select, delete, literal
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import inspect
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from sqlalchemy.orm import sessionmaker, Session as OrmSession
+from sqlalchemy import inspect, event
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import json
+import keyword
 import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 #
 #подгрузка конфиг файлов из dotevn
@@ -22,25 +30,179 @@ def _create_db_url(db_brand,db_engine,db_info:dict):
     return f"{db_brand}+{db_engine}://{db_info['user']}:{db_info['password']}@{db_info['host']}:{db_info['port']}/{db_info['database']}"
 
 
+PARTITION_INTERVALS = ('day', 'month')
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'min', 'max', 'avg')
+SUMMARIES_TABLE = '_summaries'  # каталог сводных таблиц: источник, группировка, агрегаты
+SUMMARY_FUNCTIONS = ('count', 'sum', 'avg')  # агрегаты, которые можно поддерживать дельтами (min/max - нельзя)
+ROW_COUNT = 'row_count'  # число строк группы, группа удаляется при обнулении
+GROUP_KEY = 'group_key'  # нормализованные значения группировки - первичный ключ сводной таблицы
+OPERATION_KINDS = ('read', 'write', 'ddl')  # типы операций для таймаутов и лимитов конкурентности
+# операторы фильтров purge: {'created_at': ('<', cutoff)}
+FILTER_OPERATORS = {
+    '==': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    'in': lambda column, value: column.in_(value),
+}
+TOMBSTONE_MODES = ('soft', 'table')
+UPDATED_AT = 'updated_at'  # служебный столбец ленты изменений
+DELETED_AT = 'deleted_at'  # столбец мягкого удаления
+# updated_at проставляется до commit, поэтому запись может стать видимой позже записей с большим updated_at.
+# Лента отдает только изменения старше этого запаса (сек) - он должен превышать самую долгую
+# пишущую транзакцию плюс расхождение часов между писателями
+CHANGES_SAFETY_LAG = 5.0
+TOMBSTONES_SUFFIX = '_tombstones'  # суффикс побочной таблицы удаленных записей
+SEARCH_VECTOR = 'search_vector'  # хранимый tsvector поисковых столбцов (PostgreSQL)
+FTS_SUFFIX = '_fts'  # суффикс теневой таблицы FTS5 (SQLite)
+SEARCH_CONFIG = 'simple'  # конфигурация без стемминга - подходит для имен и email
+
+
+def _utcnow() -> datetime:
+    """Текущее время в UTC без tzinfo - монотонно в отличие от локального при переводе часов"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _as_utc(moment: datetime) -> datetime:
+    """Приводит момент к UTC без tzinfo, как _utcnow; наивные значения считаются уже в UTC"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _partition_start(moment: datetime, interval: str) -> datetime:
+    """Начало периода партиции, в который попадает moment"""
+    if interval == 'day':
+        return datetime(moment.year, moment.month, moment.day)
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_partition_start(start: datetime, interval: str) -> datetime:
+    """Начало следующего периода партиции"""
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return datetime(start.year + 1, 1, 1)
+    return datetime(start.year, start.month + 1, 1)
+
+
+def _partition_name(table_name: str, start: datetime, interval: str) -> str:
+    """Имя партиции: users_p20250101 для дня, users_p202501 для месяца"""
+    suffix = start.strftime('%Y%m%d') if interval == 'day' else start.strftime('%Y%m')
+    return f"{table_name}_p{suffix}"
+
+
+class _SlotsRow:
+    '''Компактная строка на __slots__ для таблиц, столбцы которых нельзя сделать полями NamedTuple
+    (имена с подчеркиванием в начале, ключевые слова). Повторяет используемый менеджером API NamedTuple:
+    _fields, _make, _asdict, _replace'''
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self._fields):
+            raise TypeError(f"{type(self).__name__} takes at most {len(self._fields)} values, got {len(args)}")
+        values = dict(zip(self._fields, args))
+        unknown = set(kwargs) - set(self._fields)
+        if unknown:
+            raise TypeError(f"Unknown fields for {type(self).__name__}: {sorted(unknown)}")
+        values.update(kwargs)
+        for field in self._fields:
+            object.__setattr__(self, field, values.get(field))
+
+    @classmethod
+    def _make(cls, iterable: Iterable[Any]) -> "_SlotsRow":
+        return cls(*iterable)
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self._fields}
+
+    def _replace(self, **changes) -> "_SlotsRow":
+        return type(self)(**{**self._asdict(), **changes})
+
+    def __iter__(self) -> Iterator[Any]:
+        return (getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and tuple(self) == tuple(other)
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields)
+        return f'{type(self).__name__}({values})'
+
+
 class AlternativeModelManager:
-    def __init__(self,database_url,base_model=None):
+    def __init__(self,database_url,base_model=None,statement_timeouts:Dict[str,int]=None):
+         """statement_timeouts - таймауты запросов в мс по типам операций {'read': 5000, 'write': 10000, 'ddl': 60000},
+         на PostgreSQL применяются как statement_timeout на каждую транзакцию"""
+         unknown_kinds = set(statement_timeouts or {}) - set(OPERATION_KINDS)
+         if unknown_kinds:
+             raise ValueError(f"Unknown operation kinds {sorted(unknown_kinds)}, expected {OPERATION_KINDS}")
          self.database_url = database_url
+         self.statement_timeouts = dict(statement_timeouts or {})
          self.engine = create_engine(database_url,echo=False, pool_pre_ping=True)
          self.Base = base_model or declarative_base()
          self.Session = sessionmaker(bind=self.engine)
+         # таймаут применяется, когда сессия берет соединение, а не при создании сессии:
+         # иначе соединение было бы занято на время проверок таблиц, которые берут второе
+         event.listen(self.Session, 'after_begin', self._on_session_begin)
          self._models: Dict[str,Any] = {} # кэш уже созданных моделей
+         self._row_types: Dict[str,Any] = {} # кэш компактных типов строк
+         self._lock = threading.RLock() # защищает кэши и реестр Base при работе из нескольких потоков
+         self._loading: Dict[str,Future] = {} # таблицы, которые сейчас отражаются (single-flight)
+         self._summary_tables: Dict[str,Table] = {} # кэш отраженных сводных таблиц
+         self._summary_catalog_exists_known = False # каталог сводок создается один раз и не удаляется
          self._metadata = MetaData()
 
+    def _apply_statement_timeout(self, executor: Any, kind: str) -> None:
+        """Ограничивает время запросов текущей транзакции (только PostgreSQL, is_local=true - до конца транзакции)"""
+        timeout_ms = self.statement_timeouts.get(kind)
+        if timeout_ms and self.engine.dialect.name == 'postgresql':
+            executor.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                             {'timeout': str(int(timeout_ms))})
+
+    def _session(self, kind: str) -> Any:
+        """Сессия с таймаутом запросов для типа операции. Соединение из пула она берет только при первом запросе"""
+        return self.Session(info={'operation_kind': kind})
+
+    def _on_session_begin(self, session: Any, transaction: Any, connection: Any) -> None:
+        """Событие after_begin: применяет таймаут типа операции сессии к ее транзакции"""
+        self._apply_statement_timeout(connection, session.info.get('operation_kind'))
+
+    @contextmanager
+    def _begin(self, kind: str) -> Iterator[Any]:
+        """engine.begin() с таймаутом запросов для типа операции"""
+        with self.engine.begin() as connection:
+            self._apply_statement_timeout(connection, kind)
+            yield connection
+
     def _table_exists(self, table_name: str) -> bool:
         """Проверяет существование таблицы в БД"""
         inspector = inspect(self.engine)
         return inspector.has_table(table_name)
 
-    def create_model(self, table_name: str, columns_config: Dict[str, Any]) -> Any:
+    def create_model(self, table_name: str, columns_config: Dict[str, Any],
+                     partition_by: Dict[str, str] = None, track_changes: bool = False,
+                     tombstones: str = None, id_type: Any = Integer, searchable: List[str] = None) -> Any:
         """Динамически создает и возвращает класс модели SQLAlchemy.
         Args:
             table_name: Имя таблицы в базе данных
             columns_config: Словарь конфигурации столбцов {имя: тип}
+            partition_by: Секционирование по диапазону времени (только PostgreSQL),
+                          format: {'column': 'created_at', 'interval': 'day' | 'month', 'ahead': 3,
+                                   'since': datetime(2024, 1, 1)} - since (UTC) нужен для исторических данных
+            track_changes: Добавить индексированный столбец updated_at для read_changed_since
+            tombstones: Как фиксировать удаления для ленты изменений (включает track_changes):
+                        'soft' - столбец deleted_at вместо физического удаления,
+                        'table' - запись в побочную таблицу <table_name>_tombstones
+            id_type: Тип первичного ключа id (BigInteger для глобальных id шардированных таблиц)
+            searchable: Текстовые столбцы для полнотекстового поиска через search():
+                        PostgreSQL - хранимый tsvector с GIN-индексом, SQLite - теневая таблица FTS5
         Returns:
             Динамически созданный класс модели"""
         try:
@@ -53,20 +215,57 @@ class AlternativeModelManager:
                 '__tablename__': table_name,
                 '__table_args__': {'extend_existing': True}
             }
+            if tombstones is not None and tombstones not in TOMBSTONE_MODES:
+                raise ValueError(f"Unsupported tombstones mode '{tombstones}', expected one of {TOMBSTONE_MODES}")
+            if partition_by:
+                partition_column, interval = self._validate_partitioning(columns_config, partition_by)
+                # спецификацию храним в комментарии таблицы, чтобы ее видели и другие экземпляры менеджера
+                attrs['__table_args__'].update({
+                    'postgresql_partition_by': f'RANGE ({partition_column})',
+                    'comment': f'partition_by={partition_column};interval={interval}',
+                })
 
             # Добавляем автоинкрементный первичный ключ 'id'
-            attrs['id'] = Column(Integer, primary_key=True, autoincrement=True)
+            attrs['id'] = Column(id_type, primary_key=True, autoincrement=True)
              # Добавляем остальные столбцы из конфигурации
             for col_name, col_type in columns_config.items():
-                attrs[col_name] = Column(col_type)
-            # Создаем класс с помощью type
-            model_class = type(f'{table_name.title().replace("_", "")}',  # Убираем подчеркивания для имени класса
-                (self.Base,),
-                attrs)
+                # postgres требует, чтобы ключ секционирования входил в первичный ключ
+                is_partition_key = bool(partition_by) and col_name == partition_by['column']
+                attrs[col_name] = Column(col_type, primary_key=is_partition_key)
+            if track_changes or tombstones:
+                attrs[UPDATED_AT] = Column(DateTime, nullable=False, index=True, default=_utcnow)
+            if tombstones == 'soft':
+                attrs[DELETED_AT] = Column(DateTime, nullable=True)
+            if searchable:
+                self._validate_searchable(columns_config, searchable)
+                if self.engine.dialect.name == 'postgresql':
+                    document = " || ' ' || ".join(f"coalesce(\"{column}\", '')" for column in searchable)
+                    attrs[SEARCH_VECTOR] = Column(TSVECTOR, Computed(
+                        f"to_tsvector('{SEARCH_CONFIG}', {document})", persisted=True))
+            # под блокировкой только регистрация класса: реестр Base не потокобезопасен,
+            # а DDL может идти долго и не должен задерживать _get_model других таблиц
+            with self._lock:
+                # Создаем класс с помощью type
+                model_class = type(f'{table_name.title().replace("_", "")}',  # Убираем подчеркивания для имени класса
+                    (self.Base,),
+                    attrs)
+                if searchable and self.engine.dialect.name == 'postgresql':
+                    # индекс привязывается к таблице и создается вместе с ней
+                    Index(f'ix_{table_name}_{SEARCH_VECTOR}', model_class.__table__.c[SEARCH_VECTOR],
+                          postgresql_using='gin')
             # Создаем таблицу в БД
-            self.Base.metadata.create_all(self.engine, tables=[model_class.__table__])
+            with self._begin('ddl') as connection:
+                self.Base.metadata.create_all(connection, tables=[model_class.__table__])
+            if searchable and self.engine.dialect.name == 'sqlite':
+                self._create_fts_table(table_name, searchable)
+            if partition_by:
+                self.ensure_partitions(table_name, ahead=partition_by.get('ahead', 3),
+                                       since=partition_by.get('since'))
+            if tombstones == 'table':
+                self._create_tombstones_table(table_name, id_type)
             # Кэшируем модель
-            self._models[table_name] = model_class
+            with self._lock:
+                self._models[table_name] = model_class
             
             logger.info(f"Successfully created model and table '{table_name}'")
             return model_class
@@ -74,19 +273,105 @@ class AlternativeModelManager:
             logger.error(f"Error creating model '{table_name}': {str(e)}")
             raise
         
+    def _create_tombstones_table(self, table_name: str, id_type: Any = Integer) -> Any:
+        """Создает побочную таблицу удаленных записей: id исходной записи (того же типа, что в таблице) + время удаления"""
+        tombstones_name = f"{table_name}{TOMBSTONES_SUFFIX}"
+        attrs = {
+            '__tablename__': tombstones_name,
+            '__table_args__': {'extend_existing': True},
+            'id': Column(id_type, primary_key=True, autoincrement=False),
+            DELETED_AT: Column(DateTime, nullable=False),
+            UPDATED_AT: Column(DateTime, nullable=False, index=True),
+        }
+        with self._lock:
+            model_class = type(f'{tombstones_name.title().replace("_", "")}', (self.Base,), attrs)
+        with self._begin('ddl') as connection:
+            self.Base.metadata.create_all(connection, tables=[model_class.__table__])
+        with self._lock:
+            self._models[tombstones_name] = model_class
+        return model_class
+
+    def _validate_searchable(self, columns_config: Dict[str, Any], searchable: List[str]) -> None:
+        """Проверяет, что поисковые столбцы есть в конфигурации и они строковые"""
+        if self.engine.dialect.name not in ('postgresql', 'sqlite'):
+            raise ValueError(f"Full-text search is supported only on PostgreSQL and SQLite, got '{self.engine.dialect.name}'")
+        for column in searchable:
+            if column not in columns_config:
+                raise ValueError(f"Searchable column '{column}' is not in columns_config")
+            column_type = columns_config[column]
+            column_type = column_type() if isinstance(column_type, type) else column_type
+            if not isinstance(column_type, String):  # Text - подкласс String
+                raise ValueError(f"Searchable column '{column}' must be String or Text")
+
+    def _create_fts_table(self, table_name: str, searchable: List[str]) -> None:
+        """Создает теневую таблицу FTS5 над таблицей и триггеры, поддерживающие ее в актуальном состоянии"""
+        fts_name = f"{table_name}{FTS_SUFFIX}"
+        columns = ', '.join(f'"{column}"' for column in searchable)
+        new_values = ', '.join(f'new."{column}"' for column in searchable)
+        old_values = ', '.join(f'old."{column}"' for column in searchable)
+        remove_old = (f'INSERT INTO "{fts_name}"("{fts_name}", rowid, {columns}) '
+                      f"VALUES ('delete', old.id, {old_values});")
+        insert_new = f'INSERT INTO "{fts_name}"(rowid, {columns}) VALUES (new.id, {new_values});'
+        with self._begin('ddl') as connection:
+            connection.execute(text(
+                f'CREATE VIRTUAL TABLE "{fts_name}" USING fts5({columns}, '
+                f"content='{table_name}', content_rowid='id')"))
+            connection.execute(text(
+                f'CREATE TRIGGER "{fts_name}_ai" AFTER INSERT ON "{table_name}" BEGIN {insert_new} END'))
+            connection.execute(text(
+                f'CREATE TRIGGER "{fts_name}_ad" AFTER DELETE ON "{table_name}" BEGIN {remove_old} END'))
+            connection.execute(text(
+                f'CREATE TRIGGER "{fts_name}_au" AFTER UPDATE ON "{table_name}" BEGIN {remove_old} {insert_new} END'))
+        logger.info(f"Created FTS5 index '{fts_name}' for '{table_name}' on {searchable}")
+
+    def _validate_partitioning(self, columns_config: Dict[str, Any], partition_by: Dict[str, str]):
+        """Проверяет спецификацию секционирования, возвращает (столбец, интервал)"""
+        if self.engine.dialect.name != 'postgresql':
+            raise ValueError(f"Partitioning is supported only on PostgreSQL, got '{self.engine.dialect.name}'")
+        partition_column = partition_by.get('column')
+        interval = partition_by.get('interval', 'day')
+        if partition_column not in columns_config:
+            raise ValueError(f"Partition column '{partition_column}' is not in columns_config")
+        column_type = columns_config[partition_column]
+        column_type = column_type() if isinstance(column_type, type) else column_type
+        if not isinstance(column_type, DateTime):  # границы партиций - метки времени
+            raise ValueError(f"Partition column '{partition_column}' must be DateTime")
+        if interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Unsupported partition interval '{interval}', expected one of {PARTITION_INTERVALS}")
+        return partition_column, interval
+
     def _get_model(self, table_name: str, columns_config: Dict[str, Any] = None) -> Any:
         """
         Упрощенный метод получения модели.
         """
         # 1. Если модель в кэше и таблица существует - используем кэш (оптимизация)
-        if table_name in self._models and self._table_exists(table_name):
-            return self._models[table_name]
+        model = self._models.get(table_name)
+        if model is not None and self._table_exists(table_name):
+            return model
         
         # 2. Если таблица существует - отражаем её
         if self._table_exists(table_name):
-            model = self._reflect_existing_table(table_name)
-            self._models[table_name] = model  # Кэшируем для будущего использования
-            return model
+            # single-flight: параллельные промахи по одной таблице ждут одно отражение
+            with self._lock:
+                model = self._models.get(table_name)
+                if model is not None:
+                    return model
+                loading = self._loading.get(table_name)
+                is_owner = loading is None
+                if is_owner:
+                    loading = self._loading[table_name] = Future()
+            if not is_owner:
+                return loading.result()
+            try:
+                model = self._reflect_existing_table(table_name)  # кэширует модель сам
+                loading.set_result(model)
+                return model
+            except Exception as e:
+                loading.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    self._loading.pop(table_name, None)
         
         raise ValueError(f"Table '{table_name}' does not exist")
     # страый не рабочий вариант через метка класс type
@@ -124,7 +409,8 @@ class AlternativeModelManager:
         try:
             # Создаем automap base
             AutomapBase = automap_base()
-            AutomapBase.prepare(self.engine, reflect=True)
+            # отражаем только нужную таблицу (и связанные по FK), а не всю схему
+            AutomapBase.prepare(autoload_with=self.engine, reflection_options={'only': [table_name]})
             
             # Получаем класс из automap
             if hasattr(AutomapBase.classes, table_name):
@@ -139,7 +425,8 @@ class AlternativeModelManager:
                     raise ValueError(f"Table '{table_name}' not found in reflected classes")
             
             # Кэшируем модель
-            self._models[table_name] = model_class
+            with self._lock:
+                self._models[table_name] = model_class
             logger.info(f"Reflected existing table '{table_name}' into model using automap")
             
             return model_class
@@ -147,19 +434,82 @@ class AlternativeModelManager:
         except Exception as e:
             logger.error(f"Error reflecting table '{table_name}': {str(e)}")
             raise
+    def _get_by_id(self, session, model_class: Any, record_id: int) -> Optional[Any]:
+        """Ищет запись по id. В секционированных таблицах первичный ключ составной
+        (id + ключ секционирования), поэтому query.get(record_id) для них не подходит.
+        Мягко удаленные записи не возвращаются"""
+        query = session.query(model_class).filter(model_class.id == record_id)
+        if self._is_soft_delete(model_class.__table__):
+            query = query.filter(getattr(model_class, DELETED_AT).is_(None))
+        return query.first()
+
+    def _is_soft_delete(self, table: Table) -> bool:
+        """Таблица с мягким удалением - nullable deleted_at. В побочной таблице tombstones
+        deleted_at NOT NULL: ее строки - сами отметки об удалении, а не скрытые записи"""
+        return DELETED_AT in table.c and table.c[DELETED_AT].nullable
+
+    def row_type(self, table_name: str) -> Any:
+        """Возвращает компактный тип строки таблицы - NamedTuple с типизированными полями по столбцам.
+        В отличие от ORM-объекта не несет _sa_instance_state и __dict__: строка - это кортеж.
+        Поля, не переданные в конструктор, равны None; _asdict() дает словарь для записи.
+        Если имя столбца недопустимо для NamedTuple (_hidden, class), тип строится на __slots__ (_SlotsRow);
+        столбцы, имена которых не являются идентификаторами python, в компактные строки не попадают"""
+        row_type = self._row_types.get(table_name)
+        if row_type is not None:
+            return row_type
+        fields = []
+        for column in self._get_model(table_name).__table__.columns:
+            if column.key == SEARCH_VECTOR:
+                continue  # служебный вычисляемый столбец - не нужен ни для чтения, ни для записи
+            if not column.key.isidentifier() or column.key.startswith('__') or hasattr(_SlotsRow, column.key):
+                logger.warning(f"Column '{column.key}' of '{table_name}' cannot be a row field, skipped in compact rows")
+                continue
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = Any
+            fields.append((column.key, Optional[python_type]))
+        type_name = f'{table_name.title().replace("_", "")}Row'
+        if any(name.startswith('_') or keyword.iskeyword(name) for name, _ in fields):
+            names = tuple(name for name, _ in fields)
+            row_type = type(type_name, (_SlotsRow,), {'__slots__': names, '_fields': names,
+                                                      '__annotations__': dict(fields)})
+        else:
+            row_type = NamedTuple(type_name, fields)
+            row_type.__new__.__defaults__ = (None,) * len(fields)
+        with self._lock:
+            return self._row_types.setdefault(table_name, row_type)
+
+    def _as_dict(self, data: Any) -> Dict[str, Any]:
+        """Приводит компактную строку к словарю для записи, словари возвращает как есть"""
+        if isinstance(data, (tuple, _SlotsRow)) and hasattr(data, '_asdict'):
+            return {key: value for key, value in data._asdict().items() if not (key == 'id' and value is None)}
+        return data
+
+    def _stamp_updated_at(self, model_class: Any, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Проставляет updated_at в данные записи, если таблица ведет ленту изменений.
+        Нужен и для отраженных моделей, у которых нет python-default столбца"""
+        if hasattr(model_class, UPDATED_AT):
+            return {**data, UPDATED_AT: _utcnow()}
+        return data
+
     # CRUD методы становятся ПРОЩЕ
     def create_record(self, table_name: str, data: Dict[str, Any], columns_config: Dict[str, Any] = None) -> Any:
         """
         Создает запись. Если таблицы нет и передан columns_config - создает таблицу.
         """
-        session = self.Session()
+        session = self._session('write')
         try:
             if not self._table_exists(table_name):
                 logger.info(f"Указанной таблицы не существует")
                 raise ValueError
             model_class = self._get_model(table_name, columns_config)
-            instance = model_class(**data)
+            instance = model_class(**self._stamp_updated_at(model_class, self._as_dict(data)))
             session.add(instance)
+            summaries = self._summary_definitions(session, table_name)
+            if summaries:
+                session.flush()  # значения по умолчанию и id появляются после flush
+                self._apply_row_deltas(session, summaries, [(1, self._row_values(instance, summaries))])
             session.commit()
             logger.info(f"Created record in '{table_name}' with ID: {instance.id}")
             return instance
@@ -170,15 +520,55 @@ class AlternativeModelManager:
         finally:
             session.close()
 
-    def read(self, table_name: str, record_id: int) -> Optional[Any]:
-        """Читает запись по ID"""
-        session = self.Session()
+    def create_records(self, table_name: str, rows: List[Dict[str, Any]]) -> List[int]:
+        """Пакетно создает записи одной транзакцией (один commit на весь пакет).
+        Returns:
+            id созданных записей в порядке rows"""
+        session = self._session('write')
+        try:
+            if not self._table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            model_class = self._get_model(table_name)
+            table = model_class.__table__
+            # executemany требует одинаковый набор столбцов - группируем строки по нему
+            groups: Dict[Tuple[str, ...], List[int]] = {}
+            rows = [self._as_dict(row) for row in rows]
+            for position, row in enumerate(rows):
+                unknown = set(row) - set(table.c.keys())
+                if unknown:
+                    raise ValueError(f"Unknown columns for '{table_name}': {sorted(unknown)}")
+                groups.setdefault(tuple(sorted(row)), []).append(position)
+            ids: List[Optional[int]] = [None] * len(rows)
+            for positions in groups.values():
+                statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+                params = [self._stamp_updated_at(model_class, rows[position]) for position in positions]
+                for position, record_id in zip(positions, session.execute(statement, params).scalars()):
+                    ids[position] = record_id
+            summaries = self._summary_definitions(session, table_name)
+            if summaries:
+                self._apply_row_deltas(session, summaries, [(1, row) for row in rows])
+            session.commit()
+            logger.info(f"Created {len(rows)} records in '{table_name}'")
+            return ids
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error creating records in '{table_name}': {str(e)}")
+            raise
+        finally:
+            session.close()
+
+    def read(self, table_name: str, record_id: int, compact: bool = False) -> Optional[Any]:
+        """Читает запись по ID. compact=True возвращает строку типа row_type(table_name)"""
+        session = self._session('read')
         try:
             if not self._table_exists(table_name):
                 logger.info(f"Указанной таблицы не существует")
                 raise ValueError
             model_class = self._get_model(table_name)  #  Просто получаем модель
-            instance = session.query(model_class).get(record_id)
+            if compact:
+                instance = next(iter(self._select_compact(session, table_name, {'id': record_id})), None)
+            else:
+                instance = self._get_by_id(session, model_class, record_id)
             if instance:
                 return instance
             print(f"В таблице {table_name} не найдено юзера с id{record_id}")
@@ -188,15 +578,20 @@ class AlternativeModelManager:
         finally:
             session.close()
 
-    def read_all(self, table_name: str, filters: Dict[str, Any] = None) -> List[Any]:
-        """Читает все записи"""
-        session = self.Session()
+    def read_all(self, table_name: str, filters: Dict[str, Any] = None, compact: bool = False) -> List[Any]:
+        """Читает все записи. compact=True возвращает строки типа row_type(table_name)
+        прямо из Core-результата, минуя ORM - заметно быстрее и легче на больших выборках"""
+        session = self._session('read')
         try:
             if not self._table_exists(table_name):
                 logger.info(f"Указанной таблицы не существует")
                 raise ValueError
             model_class = self._get_model(table_name)  # Просто получаем модель
+            if compact:
+                return self._select_compact(session, table_name, filters)
             query = session.query(model_class)
+            if self._is_soft_delete(model_class.__table__):
+                query = query.filter(getattr(model_class, DELETED_AT).is_(None))
             
             if filters:
                 for field, value in filters.items():
@@ -211,20 +606,37 @@ class AlternativeModelManager:
         finally:
             session.close()
 
+    def _select_compact(self, session, table_name: str, filters: Dict[str, Any] = None) -> List[Any]:
+        """Выборка через Core с упаковкой строк в row_type(table_name)"""
+        table = self._get_model(table_name).__table__
+        row_type = self.row_type(table_name)
+        statement = select(*[table.c[field] for field in row_type._fields])
+        if self._is_soft_delete(table):
+            statement = statement.where(table.c[DELETED_AT].is_(None))
+        for field, value in (filters or {}).items():
+            if field in table.c:
+                statement = statement.where(table.c[field] == value)
+        return list(map(row_type._make, session.execute(statement)))
+
     def update(self, table_name: str, record_id: int, data: Dict[str, Any]) -> Optional[Any]:
         """Обновляет запись"""
-        session = self.Session()
+        session = self._session('write')
         try:
             if not self._table_exists(table_name):
                 logger.info(f"Указанной таблицы не существует")
                 raise ValueError
             model_class = self._get_model(table_name)  # Просто получаем модель
-            instance = session.query(model_class).get(record_id)
+            instance = self._get_by_id(session, model_class, record_id)
             
             if instance:
-                for key, value in data.items():
+                summaries = self._summary_definitions(session, table_name)
+                old_values = self._row_values(instance, summaries)
+                for key, value in self._stamp_updated_at(model_class, self._as_dict(data)).items():
                     if hasattr(instance, key):
                         setattr(instance, key, value)
+                if summaries:
+                    self._apply_row_deltas(session, summaries,
+                                           [(-1, old_values), (1, self._row_values(instance, summaries))])
                 session.commit()
                 return instance
             logger.error(f"В таблице {table_name} не найден юзер по id{record_id}")
@@ -237,17 +649,31 @@ class AlternativeModelManager:
             session.close()
 
     def delete(self, table_name: str, record_id: int) -> bool:
-        """Удаляет запись"""
-        session = self.Session()
+        """Удаляет запись. Для таблиц с tombstones='soft' проставляет deleted_at,
+        для tombstones='table' дополнительно пишет id в побочную таблицу"""
+        session = self._session('write')
         try:
             if not self._table_exists(table_name):
                 raise ValueError(f"указанной таблицы не существует")
 
             model_class = self._get_model(table_name)  # ✅ Просто получаем модель
-            instance = session.query(model_class).get(record_id)
+            # побочная таблица ищется до первого запроса сессии: проверка существования берет свое соединение
+            tombstones_name = f"{table_name}{TOMBSTONES_SUFFIX}"
+            tombstone_class = self._get_model(tombstones_name) if self._table_exists(tombstones_name) else None
+            instance = self._get_by_id(session, model_class, record_id)
             
             if instance:
-                session.delete(instance)
+                now = _utcnow()
+                summaries = self._summary_definitions(session, table_name)
+                if summaries:  # мягко удаленные записи тоже выпадают из сводок
+                    self._apply_row_deltas(session, summaries, [(-1, self._row_values(instance, summaries))])
+                if self._is_soft_delete(model_class.__table__):
+                    setattr(instance, DELETED_AT, now)
+                    setattr(instance, UPDATED_AT, now)
+                else:
+                    session.delete(instance)
+                    if tombstone_class is not None:
+                        session.merge(tombstone_class(**{'id': record_id, DELETED_AT: now, UPDATED_AT: now}))
                 session.commit()
                 return True
             logger.warning(f"Указанного id в таблице {table_name} не сущесвтует")
@@ -266,9 +692,20 @@ class AlternativeModelManager:
                 # Удаляем из БД
                 self._metadata.reflect(bind=self.engine, only=[table_name])
                 if table_name in self._metadata.tables:
-                    self._metadata.tables[table_name].drop(self.engine)
+                    with self._begin('ddl') as connection:
+                        self._metadata.tables[table_name].drop(connection)
                 # очищаем кэш
-                self._models.pop(table_name, None)
+                with self._lock:
+                    self._models.pop(table_name, None)
+                    self._row_types.pop(table_name, None)
+                tombstones_name = f"{table_name}{TOMBSTONES_SUFFIX}"
+                if self._table_exists(tombstones_name):
+                    self.delete_table(tombstones_name)
+                self._drop_summaries(table_name)
+                fts_name = f"{table_name}{FTS_SUFFIX}"
+                if self.engine.dialect.name == 'sqlite' and self._table_exists(fts_name):
+                    with self._begin('ddl') as connection:
+                        connection.execute(text(f'DROP TABLE "{fts_name}"'))
                 
                 logger.info(f"Table '{table_name}' dropped successfully")
                 return True
@@ -277,3 +714,644 @@ class AlternativeModelManager:
         except Exception as e:
             logger.error(f"Error dropping table '{table_name}': {str(e)}")
             raise
+
+    def read_changed_since(self, table_name: str, watermark: Union[datetime, Tuple[datetime, int]] = None,
+                           limit: int = 1000, safety_lag: float = None) -> Tuple[List[Any], Optional[Tuple[datetime, int]]]:
+        """Возвращает записи, измененные после watermark, в порядке (updated_at, id).
+        Удаленные записи приходят как объекты с заполненным deleted_at
+        (сама запись при tombstones='soft' или строка побочной таблицы при tombstones='table').
+        Изменения моложе safety_lag не отдаются: транзакция, проставившая меньший updated_at,
+        могла еще не закоммититься, и watermark ушел бы дальше ее записи.
+        Args:
+            table_name: Имя таблицы, созданной с track_changes или tombstones
+            watermark: None для чтения с начала, иначе значение, возвращенное прошлым вызовом
+            limit: Максимальное число записей за вызов
+            safety_lag: Запас в секундах, по умолчанию CHANGES_SAFETY_LAG, но не меньше таймаута записи
+                        из statement_timeouts
+        Returns:
+            (записи, следующий watermark) - если записей нет, watermark возвращается без изменений"""
+        session = self._session('read')
+        try:
+            if not self._table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            model_class = self._get_model(table_name)
+            if not hasattr(model_class, UPDATED_AT):
+                raise ValueError(f"Table '{table_name}' does not track changes, create it with track_changes=True")
+            if isinstance(watermark, datetime):
+                watermark = (watermark, None)
+            if safety_lag is None:
+                safety_lag = max(CHANGES_SAFETY_LAG, self.statement_timeouts.get('write', 0) / 1000)
+            visible_until = _utcnow() - timedelta(seconds=safety_lag)
+            sources = [model_class]
+            tombstones_name = f"{table_name}{TOMBSTONES_SUFFIX}"
+            if self._table_exists(tombstones_name):
+                sources.append(self._get_model(tombstones_name))
+
+            changes = []
+            for source in sources:
+                updated_at = getattr(source, UPDATED_AT)
+                query = session.query(source).filter(updated_at <= visible_until)
+                if watermark is not None:
+                    since, last_id = watermark
+                    if last_id is None:
+                        query = query.filter(updated_at > since)
+                    else:
+                        # id разрешает совпадения updated_at, чтобы не потерять записи на границе страницы
+                        query = query.filter(or_(updated_at > since, and_(updated_at == since, source.id > last_id)))
+                changes.extend(query.order_by(updated_at, source.id).limit(limit).all())
+            changes.sort(key=lambda change: (getattr(change, UPDATED_AT), change.id))
+            changes = changes[:limit]
+            if changes:
+                watermark = (getattr(changes[-1], UPDATED_AT), changes[-1].id)
+            return changes, watermark
+        except Exception as e:
+            logger.error(f"Error reading changes from '{table_name}': {str(e)}")
+            raise
+        finally:
+            session.close()
+
+    def search(self, table_name: str, query: str, limit: int = 20, rank: bool = True) -> List[Any]:
+        """Полнотекстовый поиск по столбцам, отмеченным searchable в create_model.
+        Совпадение ищется по словам (все слова запроса должны встретиться), а не по произвольной подстроке.
+        Args:
+            table_name: Имя таблицы
+            query: Поисковый запрос
+            limit: Максимальное число результатов
+            rank: Сортировать по релевантности (ts_rank / bm25), иначе порядок не гарантируется
+        Returns:
+            Найденные записи"""
+        session = self._session('read')
+        try:
+            if not self._table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            model_class = self._get_model(table_name)
+            table = model_class.__table__
+            soft_delete = self._is_soft_delete(table)
+            if self.engine.dialect.name == 'postgresql' and SEARCH_VECTOR in table.c:
+                ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+                statement = select(model_class).where(table.c[SEARCH_VECTOR].op('@@')(ts_query))
+                if soft_delete:
+                    statement = statement.where(table.c[DELETED_AT].is_(None))
+                if rank:
+                    statement = statement.order_by(func.ts_rank(table.c[SEARCH_VECTOR], ts_query).desc())
+                return session.execute(statement.limit(limit)).scalars().all()
+
+            fts_name = f"{table_name}{FTS_SUFFIX}"
+            if self.engine.dialect.name == 'sqlite' and self._table_exists(fts_name):
+                if not query.split():
+                    return []  # пустой MATCH - синтаксическая ошибка FTS5, postgres для него тоже ничего не находит
+                # каждое слово - фраза в кавычках, чтобы спецсимволы (@ . -) не ломали синтаксис FTS5
+                match = ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+                sql = (f'SELECT "{table_name}".* FROM "{table_name}" '
+                       f'JOIN "{fts_name}" ON "{fts_name}".rowid = "{table_name}".id '
+                       f'WHERE "{fts_name}" MATCH :match')
+                if soft_delete:
+                    sql += f' AND "{table_name}"."{DELETED_AT}" IS NULL'
+                if rank:
+                    sql += f' ORDER BY bm25("{fts_name}")'
+                statement = text(sql + ' LIMIT :limit').bindparams(match=match, limit=limit)
+                return session.query(model_class).from_statement(statement).all()
+            raise ValueError(f"Table '{table_name}' has no searchable columns")
+        except Exception as e:
+            logger.error(f"Error searching '{table_name}': {str(e)}")
+            raise
+        finally:
+            session.close()
+
+    def aggregate(self, table_name: str, aggregates: Dict[str, Tuple[str, str]],
+                  filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Считает агрегаты на стороне БД одним запросом.
+        Args:
+            table_name: Имя таблицы
+            aggregates: {'псевдоним': (функция, столбец)}, функции - AGGREGATE_FUNCTIONS,
+                        для count столбец может быть '*'
+            filters: Фильтры в формате purge
+        Returns:
+            {'псевдоним': значение}"""
+        session = self._session('read')
+        try:
+            if not self._table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            table = self._get_model(table_name).__table__
+            columns = []
+            for alias, (function, column_name) in aggregates.items():
+                if function not in AGGREGATE_FUNCTIONS:
+                    raise ValueError(f"Unsupported aggregate '{function}', expected one of {AGGREGATE_FUNCTIONS}")
+                if function == 'count' and column_name == '*':
+                    columns.append(func.count().label(alias))
+                else:
+                    columns.append(getattr(func, function)(table.c[column_name]).label(alias))
+            conditions = self._filter_conditions(table, filters)
+            if self._is_soft_delete(table):
+                conditions.append(table.c[DELETED_AT].is_(None))
+            return dict(session.execute(select(*columns).select_from(table).where(*conditions)).one()._mapping)
+        except Exception as e:
+            logger.error(f"Error aggregating '{table_name}': {str(e)}")
+            raise
+        finally:
+            session.close()
+
+    def _filter_conditions(self, table: Table, filters: Dict[str, Any] = None) -> list:
+        """Условия WHERE из фильтров: значение - равенство, кортеж (оператор, значение) - сравнение"""
+        conditions = []
+        for field, value in (filters or {}).items():
+            if field not in table.c:
+                raise ValueError(f"Unknown filter column '{field}' for '{table.name}'")
+            operator = '=='
+            if isinstance(value, tuple):
+                operator, value = value
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator '{operator}', expected one of {list(FILTER_OPERATORS)}")
+            conditions.append(FILTER_OPERATORS[operator](table.c[field], value))
+        return conditions
+
+    def _ensure_archive_table(self, table: Table, archive_name: str) -> Table:
+        """Создает (если нет) архивную таблицу с теми же столбцами, id - простой первичный ключ"""
+        if self._table_exists(archive_name):
+            return Table(archive_name, MetaData(), autoload_with=self.engine)
+        archive = Table(archive_name, MetaData(),
+                        *[Column(column.name, column.type, primary_key=column.name == 'id', autoincrement=False)
+                          for column in table.columns])
+        with self._begin('ddl') as connection:
+            archive.create(connection)
+        logger.info(f"Created archive table '{archive_name}' for '{table.name}'")
+        return archive
+
+    def purge(self, table_name: str, filters: Dict[str, Any] = None, batch_size: int = 1000,
+              sleep_between: float = 0.0, archive_to: str = None, start_after: int = 0,
+              progress: Callable[[Dict[str, Any]], Any] = None,
+              chunk_context: Callable[[], Any] = None, hard_delete: bool = False) -> Dict[str, Any]:
+        """Удаляет подходящие под фильтры записи порциями по batch_size в порядке id.
+        Каждая порция - отдельная короткая транзакция, поэтому блокировки и всплески WAL остаются малыми.
+        В таблицах с tombstones='soft' записи, как и в delete, помечаются deleted_at и попадают в ленту изменений.
+        Args:
+            table_name: Имя таблицы
+            filters: {'столбец': значение} или {'столбец': (оператор, значение)}, например
+                     {'created_at': ('<', cutoff)}; операторы - FILTER_OPERATORS
+            batch_size: Размер порции
+            sleep_between: Пауза между порциями в секундах
+            archive_to: Имя архивной таблицы - строки копируются в нее (INSERT ... SELECT) перед удалением
+            start_after: id, с которого продолжить прерванную очистку (last_id из прогресса)
+            progress: Вызывается после каждой порции со словарем прогресса
+            chunk_context: Фабрика контекста, в котором выполняется каждая порция (без пауз между ними),
+                           например допуск ограничителя конкурентности
+            hard_delete: Для tombstones='soft' - физически удалить записи (в том числе уже помеченные),
+                         например при очистке по сроку хранения; в ленте изменений такие удаления не видны
+        Returns:
+            {'deleted': удалено, 'batches': порций, 'last_id': последний обработанный id}"""
+        try:
+            if not self._table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            table = self._get_model(table_name).__table__
+            conditions = self._filter_conditions(table, filters)
+            soft_delete = self._is_soft_delete(table) and not hard_delete
+            if soft_delete:  # уже помеченные записи не выбираем повторно
+                conditions.append(table.c[DELETED_AT].is_(None))
+            archive = self._ensure_archive_table(table, archive_to) if archive_to else None
+            tombstones_name = f"{table_name}{TOMBSTONES_SUFFIX}"
+            tombstones = self._get_model(tombstones_name).__table__ if self._table_exists(tombstones_name) else None
+            state = {'deleted': 0, 'batches': 0, 'last_id': start_after}
+            while True:
+                with (chunk_context or nullcontext)(), self._begin('write') as connection:
+                    ids = connection.execute(
+                        select(table.c.id).where(*conditions, table.c.id > state['last_id'])
+                        .order_by(table.c.id).limit(batch_size)
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    chunk = table.c.id.in_(ids)
+                    summaries = self._summary_definitions(connection, table_name)
+                    if summaries:
+                        chunk_conditions = [chunk]
+                        if self._is_soft_delete(table):  # мягко удаленные уже вычтены из сводок при delete
+                            chunk_conditions.append(table.c[DELETED_AT].is_(None))
+                        self._apply_query_deltas(connection, summaries, table, chunk_conditions, sign=-1)
+                    if archive is not None:
+                        columns = [column.name for column in table.columns]
+                        connection.execute(insert(archive).from_select(
+                            columns, select(*[table.c[name] for name in columns]).where(chunk)))
+                    if tombstones is not None:
+                        # id может уже лежать в побочной таблице (SQLite переиспользует id удаленных строк) -
+                        # тогда обновляем его отметку, как session.merge в delete
+                        now = _utcnow()
+                        dialect_insert = postgresql_insert if self.engine.dialect.name == 'postgresql' else sqlite_insert
+                        statement = dialect_insert(tombstones).from_select(
+                            ['id', DELETED_AT, UPDATED_AT], select(table.c.id, literal(now), literal(now)).where(chunk))
+                        connection.execute(statement.on_conflict_do_update(
+                            index_elements=[tombstones.c.id],
+                            set_={DELETED_AT: statement.excluded[DELETED_AT], UPDATED_AT: statement.excluded[UPDATED_AT]}))
+                    if soft_delete:
+                        now = _utcnow()
+                        connection.execute(table.update().where(chunk).values({DELETED_AT: now, UPDATED_AT: now}))
+                    else:
+                        connection.execute(delete(table).where(chunk))
+                # порция закоммичена - прогресс можно сохранять для возобновления
+                state['deleted'] += len(ids)
+                state['batches'] += 1
+                state['last_id'] = ids[-1]
+                logger.info(f"Purged {state['deleted']} records from '{table_name}', last id {state['last_id']}")
+                if progress:
+                    progress(dict(state))
+                if sleep_between:
+                    time.sleep(sleep_between)
+            logger.info(f"Purge of '{table_name}' finished: {state}")
+            return state
+        except Exception as e:
+            logger.error(f"Error purging records from '{table_name}': {str(e)}")
+            raise
+
+    def _pool_capacity(self) -> int:
+        """Сколько соединений может выдать пул движка одновременно"""
+        pool = self.engine.pool
+        if callable(getattr(pool, 'size', None)):  # QueuePool: постоянные соединения + overflow
+            return pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+        return 1
+
+    def run_concurrently(self, ops: Iterable[Union[Callable[[], Any], Tuple]], max_workers: int = None,
+                         return_exceptions: bool = False) -> List[Any]:
+        """Выполняет независимые операции в пуле потоков, размер которого по умолчанию равен пулу соединений.
+        Каждая операция держит не больше одного соединения за раз, поэтому потоки не ждут друг друга в пуле.
+        Args:
+            ops: Операции - вызываемые объекты без аргументов или кортежи
+                 (имя_метода, args) / (имя_метода, args, kwargs), например ('read', ('users', 1))
+            max_workers: Число потоков, по умолчанию - емкость пула соединений
+            return_exceptions: Вернуть исключения на месте результатов вместо выброса первого из них
+        Returns:
+            Результаты в порядке ops"""
+        calls = []
+        for op in ops:
+            if callable(op):
+                calls.append(op)
+                continue
+            method_name, args, kwargs = (tuple(op) + ({},))[:3]
+            method = getattr(self, method_name)
+            calls.append(lambda method=method, args=args, kwargs=kwargs: method(*args, **kwargs))
+        if not calls:
+            return []
+        max_workers = min(max_workers or self._pool_capacity(), len(calls))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='run_concurrently') as executor:
+            futures = [executor.submit(call) for call in calls]
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
+
+    def _partition_spec(self, table_name: str):
+        """Читает спецификацию секционирования из комментария таблицы, возвращает (столбец, интервал)"""
+        comment = inspect(self.engine).get_table_comment(table_name).get('text') or ''
+        spec = dict(part.split('=', 1) for part in comment.split(';') if '=' in part)
+        if 'partition_by' not in spec:
+            raise ValueError(f"Table '{table_name}' is not partitioned")
+        return spec['partition_by'], spec.get('interval', 'day')
+
+    def _list_partitions(self, table_name: str) -> List[str]:
+        """Возвращает имена партиций таблицы"""
+        query = text("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = :table_name
+        """)
+        with self.engine.connect() as connection:
+            return [row[0] for row in connection.execute(query, {'table_name': table_name})]
+
+    def ensure_partitions(self, table_name: str, ahead: int = 3, since: datetime = None) -> List[str]:
+        """Создает партиции для текущего периода (по UTC) и ahead следующих.
+        Строки вне созданных партиций postgres не примет, поэтому для загрузки исторических данных
+        нужно сначала создать партиции с периода since.
+        Args:
+            ahead: Сколько периодов вперед создать
+            since: Момент в UTC, начиная с периода которого создать партиции (для backfill)
+        Returns:
+            Имена созданных партиций"""
+        try:
+            _, interval = self._partition_spec(table_name)
+            existing = set(self._list_partitions(table_name))
+            created = []
+            since = _as_utc(since) if since is not None else None
+            last = _partition_start(_utcnow(), interval)
+            for _ in range(ahead):
+                last = _next_partition_start(last, interval)
+            start = _partition_start(min(since or last, _utcnow()), interval)
+            with self._begin('ddl') as connection:
+                while start <= last:
+                    end = _next_partition_start(start, interval)
+                    partition = _partition_name(table_name, start, interval)
+                    if partition not in existing:
+                        connection.execute(text(
+                            f'CREATE TABLE IF NOT EXISTS "{partition}" PARTITION OF "{table_name}" '
+                            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                        ))
+                        created.append(partition)
+                    start = end
+            if created:
+                logger.info(f"Created partitions for '{table_name}': {created}")
+            return created
+        except Exception as e:
+            logger.error(f"Error creating partitions for '{table_name}': {str(e)}")
+            raise
+
+    def drop_partitions_older_than(self, table_name: str, cutoff: datetime) -> List[str]:
+        """Отсоединяет и удаляет партиции, целиком лежащие раньше cutoff (в UTC, как и границы партиций).
+        Вместо построчного delete удаляется вся партиция сразу.
+        Returns:
+            Имена удаленных партиций"""
+        try:
+            cutoff = _as_utc(cutoff)
+            partition_column, interval = self._partition_spec(table_name)
+            table = self._get_model(table_name).__table__
+            date_format = '%Y%m%d' if interval == 'day' else '%Y%m'
+            prefix = f"{table_name}_p"
+            dropped = []
+            partitions = sorted(self._list_partitions(table_name))  # до транзакции, чтобы не брать второе соединение
+            with self._begin('ddl') as connection:
+                for partition in partitions:
+                    try:
+                        start = datetime.strptime(partition[len(prefix):], date_format)
+                    except ValueError:
+                        continue  # партиция создана не менеджером - не трогаем
+                    end = _next_partition_start(start, interval)
+                    if end > cutoff:
+                        continue
+                    summaries = self._summary_definitions(connection, table_name)
+                    if summaries:  # вычитаем партицию из сводок одним GROUP BY по ее диапазону
+                        conditions = [table.c[partition_column] >= start, table.c[partition_column] < end]
+                        if self._is_soft_delete(table):
+                            conditions.append(table.c[DELETED_AT].is_(None))
+                        self._apply_query_deltas(connection, summaries, table, conditions, sign=-1)
+                    connection.execute(text(f'ALTER TABLE "{table_name}" DETACH PARTITION "{partition}"'))
+                    connection.execute(text(f'DROP TABLE "{partition}"'))
+                    dropped.append(partition)
+            logger.info(f"Dropped partitions of '{table_name}' older than {cutoff}: {dropped}")
+            return dropped
+        except Exception as e:
+            logger.error(f"Error dropping partitions of '{table_name}': {str(e)}")
+            raise
+
+    def _summary_catalog(self) -> Table:
+        """Описание таблицы-каталога сводок"""
+        return Table(SUMMARIES_TABLE, MetaData(),
+                     Column('summary_table', String(255), primary_key=True),
+                     Column('source_table', String(255), nullable=False, index=True),
+                     Column('group_by', Text, nullable=False),
+                     Column('aggregates', Text, nullable=False))
+
+    def _executor_connection(self, executor: Any) -> Any:
+        """Соединение, на котором работает executor (сессия или соединение) - чтобы не брать из пула второе"""
+        return executor.connection() if isinstance(executor, OrmSession) else executor
+
+    def _summary_catalog_exists(self, executor: Any) -> bool:
+        """Есть ли каталог сводок. Проверяется на соединении executor, после появления запоминается"""
+        if not self._summary_catalog_exists_known:
+            self._summary_catalog_exists_known = inspect(self._executor_connection(executor)).has_table(SUMMARIES_TABLE)
+        return self._summary_catalog_exists_known
+
+    def _summary_definitions(self, executor: Any, source_table: str) -> List[Dict[str, Any]]:
+        """Сводки, которые нужно обновлять при записи в source_table.
+        Читаются в той же транзакции, что и запись (поиск по индексу source_table), поэтому сводку,
+        созданную другим процессом, поддерживает уже первая запись после ее создания"""
+        if not self._summary_catalog_exists(executor):
+            return []
+        catalog = self._summary_catalog()
+        rows = executor.execute(select(catalog).where(catalog.c.source_table == source_table)).all()
+        return [{
+            'summary_table': row.summary_table,
+            'source_table': row.source_table,
+            'group_by': json.loads(row.group_by),
+            'aggregates': {alias: tuple(spec) for alias, spec in json.loads(row.aggregates).items()},
+            'table': self._summary_table(executor, row.summary_table),
+        } for row in rows]
+
+    def _summary_table(self, executor: Any, summary_table: str) -> Table:
+        """Отраженная сводная таблица из кэша, при промахе отражается на соединении executor"""
+        table = self._summary_tables.get(summary_table)
+        if table is None:
+            table = Table(summary_table, MetaData(), autoload_with=self._executor_connection(executor))
+            with self._lock:
+                table = self._summary_tables.setdefault(summary_table, table)
+        return table
+
+    def _summary_columns(self, aggregates: Dict[str, Tuple[str, str]]) -> Dict[str, Tuple[str, str]]:
+        """Хранимые столбцы сводки: avg хранится как сумма и количество, остальное - как есть"""
+        columns = {}
+        for alias, (function, column_name) in aggregates.items():
+            if function == 'avg':
+                columns[f'{alias}__sum'] = ('sum', column_name)
+                columns[f'{alias}__count'] = ('count', column_name)
+            else:
+                columns[alias] = (function, column_name)
+        return columns
+
+    def _group_key(self, summary: Dict[str, Any], values: Tuple[Any, ...]) -> str:
+        """Ключ группы: значения группировки, приведенные к python-типу столбцов (1 и True - одна группа)"""
+        normalized = []
+        for column_name, value in zip(summary['group_by'], values):
+            try:
+                python_type = summary['table'].c[column_name].type.python_type
+            except NotImplementedError:
+                python_type = None
+            if value is not None and python_type in (bool, int, float, str):
+                value = python_type(value)
+            normalized.append(value)
+        return json.dumps(normalized, default=str)
+
+    def _row_values(self, instance: Any, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Значения столбцов записи, нужные сводкам"""
+        names = set()
+        for summary in summaries:
+            names.update(summary['group_by'])
+            names.update(column for _, column in summary['aggregates'].values() if column != '*')
+        return {name: getattr(instance, name, None) for name in names}
+
+    def _apply_row_deltas(self, executor: Any, summaries: List[Dict[str, Any]],
+                          changes: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Применяет к сводкам изменения отдельных строк: (+1, значения) - строка добавлена, (-1, ...) - убрана"""
+        for summary in summaries:
+            columns = self._summary_columns(summary['aggregates'])
+            deltas: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+            for sign, values in changes:
+                group = tuple(values.get(column) for column in summary['group_by'])
+                delta = deltas.setdefault(group, dict.fromkeys([ROW_COUNT, *columns], 0))
+                delta[ROW_COUNT] += sign
+                for name, (function, column_name) in columns.items():
+                    value = None if column_name == '*' else values.get(column_name)
+                    if function == 'count':
+                        delta[name] += sign if column_name == '*' or value is not None else 0
+                    elif value is not None:
+                        delta[name] += sign * value
+            self._upsert_summary_deltas(executor, summary, deltas)
+
+    def _apply_query_deltas(self, executor: Any, summaries: List[Dict[str, Any]], table: Table,
+                            conditions: list, sign: int) -> None:
+        """Применяет к сводкам агрегаты выборки из source-таблицы одним GROUP BY - O(групп), а не O(строк)"""
+        for summary in summaries:
+            columns = self._summary_columns(summary['aggregates'])
+            group_columns = [table.c[column] for column in summary['group_by']]
+            selected = [func.count().label(ROW_COUNT)]
+            for name, (function, column_name) in columns.items():
+                if function == 'count':
+                    selected.append((func.count() if column_name == '*' else func.count(table.c[column_name])).label(name))
+                else:
+                    selected.append(func.sum(table.c[column_name]).label(name))
+            result = executor.execute(select(*group_columns, *selected).select_from(table)
+                                      .where(*conditions).group_by(*group_columns))
+            deltas = {}
+            for row in result:
+                group = tuple(row[:len(group_columns)])
+                aggregates = row._mapping
+                deltas[group] = {name: sign * (aggregates[name] or 0) for name in [ROW_COUNT, *columns]}
+            self._upsert_summary_deltas(executor, summary, deltas)
+
+    def _upsert_summary_deltas(self, executor: Any, summary: Dict[str, Any],
+                               deltas: Dict[Tuple[Any, ...], Dict[str, Any]]) -> None:
+        """Прибавляет дельты к строкам групп (INSERT ... ON CONFLICT DO UPDATE), пустые группы удаляет"""
+        table = summary['table']
+        dialect_insert = postgresql_insert if self.engine.dialect.name == 'postgresql' else sqlite_insert
+        touched = []
+        for group, delta in deltas.items():
+            if not any(delta.values()):
+                continue  # например, update не менял столбцы сводки
+            group_key = self._group_key(summary, group)
+            touched.append(group_key)
+            statement = dialect_insert(table).values(
+                **{GROUP_KEY: group_key}, **dict(zip(summary['group_by'], group)), **delta)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c[GROUP_KEY]],
+                set_={name: table.c[name] + statement.excluded[name] for name in delta})
+            executor.execute(statement)
+        if touched:
+            executor.execute(delete(table).where(table.c[GROUP_KEY].in_(touched), table.c[ROW_COUNT] <= 0))
+
+    def create_summary(self, source_table: str, group_by: List[str], aggregates: Dict[str, Tuple[str, str]],
+                       summary_table: str = None) -> str:
+        """Создает сводную таблицу, которую create_record/create_records/update/delete/purge
+        и удаление партиций поддерживают инкрементально, и заполняет ее по текущим данным.
+        Args:
+            source_table: Таблица-источник
+            group_by: Столбцы группировки
+            aggregates: {'псевдоним': (функция, столбец)}, функции - SUMMARY_FUNCTIONS, для count столбец может быть '*'
+            summary_table: Имя сводной таблицы, по умолчанию <source_table>_summary
+        Returns:
+            Имя сводной таблицы"""
+        summary_table = summary_table or f"{source_table}_summary"
+        try:
+            if self.engine.dialect.name not in ('postgresql', 'sqlite'):
+                raise ValueError(f"Summary tables are supported only on PostgreSQL and SQLite, got '{self.engine.dialect.name}'")
+            if not self._table_exists(source_table):
+                raise ValueError(f"Table '{source_table}' does not exist")
+            if self._table_exists(summary_table):
+                raise ValueError(f"Table '{summary_table}' already exists")
+            source = self._get_model(source_table).__table__
+            for column_name in group_by:
+                if column_name not in source.c:
+                    raise ValueError(f"Unknown group_by column '{column_name}' for '{source_table}'")
+            for alias, (function, column_name) in aggregates.items():
+                if function not in SUMMARY_FUNCTIONS:
+                    raise ValueError(f"Aggregate '{function}' cannot be maintained incrementally, expected one of {SUMMARY_FUNCTIONS}")
+                if column_name not in source.c and not (function == 'count' and column_name == '*'):
+                    raise ValueError(f"Unknown aggregate column '{column_name}' for '{source_table}'")
+
+            columns = [Column(GROUP_KEY, Text, primary_key=True)]
+            columns += [Column(column_name, source.c[column_name].type) for column_name in group_by]
+            columns.append(Column(ROW_COUNT, BigInteger, nullable=False, default=0))
+            for name, (function, column_name) in self._summary_columns(aggregates).items():
+                if function == 'count':
+                    column_type = BigInteger
+                else:  # сумма целых остается целой, остальное - Numeric/Float
+                    source_type = source.c[column_name].type
+                    column_type = source_type if isinstance(source_type, (Integer, Numeric)) else Float
+                columns.append(Column(name, column_type, nullable=False, default=0))
+            catalog = self._summary_catalog()
+            with self._begin('ddl') as connection:
+                catalog.create(connection, checkfirst=True)
+                Table(summary_table, MetaData(), *columns).create(connection)
+                connection.execute(insert(catalog).values(
+                    summary_table=summary_table, source_table=source_table,
+                    group_by=json.dumps(group_by), aggregates=json.dumps(aggregates)))
+            logger.info(f"Created summary '{summary_table}' over '{source_table}' by {group_by}")
+            self.rebuild_summary(summary_table)
+            return summary_table
+        except Exception as e:
+            logger.error(f"Error creating summary '{summary_table}': {str(e)}")
+            raise
+
+    def _drop_summaries(self, table_name: str) -> None:
+        """Вызывается из delete_table: удаляет сводки над таблицей-источником и саму таблицу из каталога сводок"""
+        if not self._table_exists(SUMMARIES_TABLE):
+            return
+        catalog = self._summary_catalog()
+        with self._begin('ddl') as connection:
+            summary_tables = connection.execute(select(catalog.c.summary_table).where(
+                catalog.c.source_table == table_name)).scalars().all()
+            connection.execute(delete(catalog).where(or_(
+                catalog.c.source_table == table_name, catalog.c.summary_table == table_name)))
+        with self._lock:
+            self._summary_tables.pop(table_name, None)
+        for summary_table in summary_tables:
+            self.delete_table(summary_table)
+
+    def _find_summary(self, executor: Any, summary_table: str) -> Dict[str, Any]:
+        """Описание сводки по имени сводной таблицы"""
+        if self._summary_catalog_exists(executor):
+            catalog = self._summary_catalog()
+            source_table = executor.execute(select(catalog.c.source_table).where(
+                catalog.c.summary_table == summary_table)).scalar()
+            for summary in self._summary_definitions(executor, source_table) if source_table else []:
+                if summary['summary_table'] == summary_table:
+                    return summary
+        raise ValueError(f"Summary '{summary_table}' does not exist")
+
+    def rebuild_summary(self, summary_table: str) -> int:
+        """Пересчитывает сводку с нуля по таблице-источнику (заполнение, исправление расхождений).
+        Returns:
+            Число групп"""
+        try:
+            # модель источника получается до транзакции записи: ее отражение берет свое соединение
+            with self._begin('read') as connection:
+                source_table = self._find_summary(connection, summary_table)['source_table']
+            source = self._get_model(source_table).__table__
+            with self._begin('write') as connection:
+                summary = self._find_summary(connection, summary_table)
+                conditions = [source.c[DELETED_AT].is_(None)] if self._is_soft_delete(source) else []
+                connection.execute(delete(summary['table']))
+                self._apply_query_deltas(connection, [summary], source, conditions, sign=1)
+                groups = connection.execute(select(func.count()).select_from(summary['table'])).scalar()
+            logger.info(f"Rebuilt summary '{summary_table}': {groups} groups")
+            return groups
+        except Exception as e:
+            logger.error(f"Error rebuilding summary '{summary_table}': {str(e)}")
+            raise
+
+    def read_summary(self, summary_table: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Читает сводку за O(групп): значения группировки, row_count и агрегаты (avg вычисляется из суммы и количества).
+        Args:
+            filters: Фильтры по столбцам группировки в формате purge"""
+        try:
+            summary, rows = self._read_summary_rows(summary_table, filters)
+            return [self._summary_result(summary, values) for values in rows]
+        except Exception as e:
+            logger.error(f"Error reading summary '{summary_table}': {str(e)}")
+            raise
+
+    def _read_summary_rows(self, summary_table: str, filters: Dict[str, Any] = None):
+        """Описание сводки и ее хранимые строки (avg - как сумма и количество), возвращает (сводка, строки)"""
+        with self._begin('read') as connection:
+            summary = self._find_summary(connection, summary_table)
+            table = summary['table']
+            rows = connection.execute(select(table).where(*self._filter_conditions(table, filters))).all()
+        return summary, [dict(row._mapping) for row in rows]
+
+    def _summary_result(self, summary: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+        """Строка результата read_summary из хранимой строки сводки"""
+        result = {column: values[column] for column in summary['group_by']}
+        result[ROW_COUNT] = values[ROW_COUNT]
+        for alias, (function, _) in summary['aggregates'].items():
+            if function == 'avg':
+                count = values[f'{alias}__count']
+                result[alias] = values[f'{alias}__sum'] / count if count else None
+            else:
+                result[alias] = values[alias]
+        return result
@@ -0,0 +1,165 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db_tools.sharding import PartialWriteError
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    '''Буферизованная запись строк в таблицу: create_record из многих потоков
+    копятся в очереди и вставляются фоновым потоком пакетами через create_records.
+    Один commit на пакет вместо commit на каждую строку.
+
+    manager - AlternativeModelManager, ShardedModelManager или DBManagerInterface (нужен метод create_records).
+    Шардированный пакет пишется на каждый шард отдельной транзакцией: при PartialWriteError
+    повторяются только строки незаписанных шардов'''
+
+    def __init__(self, manager: Any, table_name: str, max_batch: int = 500,
+                 max_delay_ms: int = 50, max_buffer: int = 10000):
+        """
+        Args:
+            manager: Менеджер с методом create_records(table_name, rows)
+            table_name: Имя таблицы для вставки
+            max_batch: Максимальный размер пакета вставки
+            max_delay_ms: Сколько ждать добора пакета после первой строки
+            max_buffer: Размер очереди - при заполнении submit блокируется (backpressure)
+        """
+        self.manager = manager
+        self.table_name = table_name
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Future]]]" = queue.Queue(maxsize=max_buffer)
+        self._closed = False
+        self._lock = threading.Lock()  # закрытие не должно пересекаться с постановкой в очередь
+        self._worker = threading.Thread(target=self._run, name=f'BufferedWriter-{table_name}', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)  # гарантия сброса буфера при завершении процесса
+
+    def submit(self, data: Dict[str, Any], callback: Callable[[Future], Any] = None,
+               timeout: float = None) -> Future:
+        """Ставит строку в очередь на вставку. Потокобезопасен.
+        Args:
+            data: Данные строки
+            callback: Вызывается с future после вставки или ошибки
+            timeout: Сколько ждать места в заполненном буфере, None - без ограничения
+        Returns:
+            Future с id созданной записи или исключением
+        Raises:
+            queue.Full: Буфер заполнен и timeout истек
+            RuntimeError: Writer уже закрыт"""
+        future: Future = Future()
+        if callback:
+            future.add_done_callback(callback)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"BufferedWriter for '{self.table_name}' is closed")
+            self._queue.put((data, future), timeout=timeout)
+        return future
+
+    async def submit_async(self, data: Dict[str, Any]) -> int:
+        """Асинхронный вариант submit: ждет вставки и возвращает id записи.
+        При заполненном буфере ожидание места уходит в executor, не блокируя event loop"""
+        try:
+            future = self.submit(data, timeout=0)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(None, self.submit, data)
+        return await asyncio.wrap_future(future)
+
+    def close(self, timeout: float = None) -> None:
+        """Прекращает прием строк и дожидается вставки всего буфера"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)  # будим фоновый поток
+        self._worker.join(timeout)
+        atexit.unregister(self.close)
+        logger.info(f"BufferedWriter for '{self.table_name}' closed")
+
+    def __enter__(self) -> "BufferedWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _next_batch(self) -> Tuple[List[Tuple[Dict[str, Any], Future]], bool]:
+        """Собирает пакет: ждет первую строку, затем добирает до max_batch или max_delay.
+        Returns:
+            (пакет, получен ли сигнал закрытия)"""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._flush(batch)
+        # после сигнала закрытия в очереди может остаться хвост - вставляем его
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for start in range(0, len(rest), self.max_batch):
+            self._flush(rest[start:start + self.max_batch])
+
+    def _flush(self, batch: List[Tuple[Dict[str, Any], Future]]) -> None:
+        """Вставляет пакет и раздает результаты по future"""
+        batch = [(data, future) for data, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            ids = self.manager.create_records(self.table_name, [data for data, _ in batch])
+        except PartialWriteError as e:
+            # шардированный пакет записан на части шардов - повторяем только строки незаписанных,
+            # иначе записанные строки вставились бы второй раз
+            logger.warning(f"Batch insert into '{self.table_name}' partially failed, retrying failed rows: {str(e)}")
+            for (data, future), record_id in zip(batch, e.ids):
+                if record_id is not None:
+                    future.set_result(record_id)
+                else:
+                    self._insert_one(data, future)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # пакет откатился целиком - вставляем по одной, чтобы ошибка досталась только виновной строке
+            logger.warning(f"Batch insert into '{self.table_name}' failed, retrying row by row: {str(e)}")
+            for data, future in batch:
+                self._insert_one(data, future)
+            return
+        for (_, future), record_id in zip(batch, ids):
+            future.set_result(record_id)
+
+    def _insert_one(self, data: Dict[str, Any], future: Future) -> None:
+        """Вставляет одну строку (одна строка пишется на один шард - атомарно) и отдает результат в future"""
+        try:
+            future.set_result(self.manager.create_records(self.table_name, [data])[0])
+        except Exception as row_error:
+            future.set_exception(row_error)
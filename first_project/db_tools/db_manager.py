@@ -4,6 +4,7 @@ import psycopg2
 from dotenv import load_dotenv
 # логирование
 import logging
+import threading
 # алхимия
 from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean, Table
 from sqlalchemy.ext.declarative import declarative_base
@@ -36,6 +37,7 @@ class DynamicModelManager:
         self.Base = declarative_base()
         self.Session = sessionmaker(bind=self.engine)
         self.created_models = {}
+        self._lock = threading.RLock()  # защищает created_models и реестр Base
         
         logger.info(f"Initialized DynamicModelManager for database: {db_url}")
 
@@ -45,7 +47,15 @@ class DynamicModelManager:
         return inspector.has_table(table_name)
 
     def _create_model_from_existing_table(self, table_name: str):
-        """Создает модель из существующей таблицы через рефлексию"""
+        """Создает модель из существующей таблицы через рефлексию.
+        Под блокировкой: параллельные промахи по одной таблице дождутся одной рефлексии"""
+        with self._lock:
+            if table_name in self.created_models:
+                return self.created_models[table_name]
+            return self._reflect_table(table_name)
+
+    def _reflect_table(self, table_name: str):
+        """Рефлексия таблицы, вызывается под self._lock"""
         try:
             # Создаем метаданные и отражаем таблицу из базы
             metadata = MetaData()
@@ -77,6 +87,11 @@ class DynamicModelManager:
         """
         Динамически создает модель и таблицу в БД
         """
+        with self._lock:
+            return self._create_dynamic_model(table_name, columns_config)
+
+    def _create_dynamic_model(self, table_name: str, columns_config: dict):
+        """Создание модели, вызывается под self._lock"""
         try:
             # Проверяем в базе данных
             if self._table_exists(table_name):
@@ -157,11 +172,10 @@ class DynamicModelManager:
                 raise ValueError(f"Table {table_name} not found. Create it first.")
 
             # Если модель еще не создана в этом экземпляре - создаем ее
-            if table_name not in self.created_models:
+            model_class = self.created_models.get(table_name)
+            if model_class is None:
                 logger.warning(f"Model for table {table_name} not found in cache. Creating model from existing table.")
-                self._create_model_from_existing_table(table_name)
-
-            model_class = self.created_models[table_name]
+                model_class = self._create_model_from_existing_table(table_name)
             session = self.get_session()
             
             instance = model_class(**data)
@@ -182,10 +196,9 @@ class DynamicModelManager:
                 raise ValueError(f"Table {table_name} not found")
 
             # Если модель еще не создана - создаем ее
-            if table_name not in self.created_models:
-                self._create_model_from_existing_table(table_name)
-
-            model_class = self.created_models[table_name]
+            model_class = self.created_models.get(table_name)
+            if model_class is None:
+                model_class = self._create_model_from_existing_table(table_name)
             session = self.get_session()
             
             return session.query(model_class).all()
@@ -198,17 +211,15 @@ class DynamicModelManager:
         """Удаляет таблицу из БД"""
         try:
             if self._table_exists(table_name):
-                if table_name in self.created_models:
-                    model_class = self.created_models[table_name]
+                with self._lock:
+                    model_class = self.created_models.pop(table_name, None)
+                if model_class is not None:
                     model_class.__table__.drop(self.engine)
                 else:
                     # Если модели нет в кеше, но таблица существует
                     metadata = MetaData()
                     table = Table(table_name, metadata, autoload_with=self.engine)
                     table.drop(self.engine)
-                
-                if table_name in self.created_models:
-                    del self.created_models[table_name]
                     
                 logger.info(f"Table {table_name} dropped successfully")
             else:
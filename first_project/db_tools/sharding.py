@@ -0,0 +1,514 @@
+import atexit
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, MetaData, String, Table, delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from db_tools.alternative import GROUP_KEY, UPDATED_AT, AlternativeModelManager, _utcnow
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATALOG_TABLE = '_sharded_tables'  # на первом шарде: какая таблица по какому ключу шардирована
+NODES_TABLE = '_id_nodes'  # на первом шарде: занятые node_id генераторов id и их владельцы
+
+# глобальный id: | 41 бит мс от ID_EPOCH_MS | 10 бит узел | 6 бит шард | 6 бит счетчик |
+ID_EPOCH_MS = 1704067200000  # 2024-01-01 UTC
+NODE_BITS, SHARD_BITS, SEQUENCE_BITS = 10, 6, 6
+MAX_NODES = 1 << NODE_BITS
+MAX_SHARDS = 1 << SHARD_BITS
+CLAIM_ATTEMPTS = 5  # попыток занять node_id при гонке с другими процессами
+# аренда node_id: владелец продлевает claimed_at каждые NODE_LEASE_SECONDS / 4, номер с claimed_at старше
+# NODE_LEASE_SECONDS считается свободным (владелец упал или потерял связь с первым шардом)
+NODE_LEASE_SECONDS = 60.0
+
+
+class PartialWriteError(RuntimeError):
+    '''create_records записал строки только части шардов: каждый шард пишется своей транзакцией.
+    ids - id строк в порядке rows (None у незаписанных), errors - {позиция незаписанной строки: ошибка ее шарда}'''
+
+    def __init__(self, message: str, ids: List[Optional[int]], errors: Dict[int, Exception]):
+        super().__init__(message)
+        self.ids = ids
+        self.errors = errors
+
+
+class _GlobalIds:
+    '''Генератор глобально уникальных id (по схеме snowflake), номер шарда зашит в id,
+    поэтому read/update/delete находят шард по самому id без обращения к ключу шардирования.
+    Уникальность между процессами обеспечивается разными node_id - их выдает ShardedModelManager.
+    Номер действителен до valid_until (по time.monotonic()), пока продлевается его аренда'''
+
+    def __init__(self, node_id: int, valid_until: float = float('inf')):
+        if not 0 <= node_id < MAX_NODES:
+            raise ValueError(f"node_id must be from 0 to {MAX_NODES - 1}, got {node_id}")
+        self.node_id = node_id
+        self.valid_until = valid_until
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self, shard_index: int) -> int:
+        if time.monotonic() > self.valid_until:
+            # аренду не удалось продлить, номер мог уже занять другой процесс - его id совпали бы с нашими
+            raise RuntimeError(f"Lease of id node {self.node_id} has expired, see table '{NODES_TABLE}'")
+        with self._lock:
+            now_ms = max(int(time.time() * 1000) - ID_EPOCH_MS, self._last_ms)  # часы не идут назад
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & ((1 << SEQUENCE_BITS) - 1)
+                if self._sequence == 0:  # счетчик миллисекунды исчерпан - ждем следующую
+                    while now_ms <= self._last_ms:
+                        now_ms = int(time.time() * 1000) - ID_EPOCH_MS
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return ((now_ms << (NODE_BITS + SHARD_BITS + SEQUENCE_BITS))
+                    | (self.node_id << (SHARD_BITS + SEQUENCE_BITS))
+                    | (shard_index << SEQUENCE_BITS)
+                    | self._sequence)
+
+
+def shard_of_id(record_id: int) -> int:
+    """Номер шарда, зашитый в глобальный id"""
+    return (record_id >> SEQUENCE_BITS) & (MAX_SHARDS - 1)
+
+
+class ShardedModelManager:
+    '''Менеджер таблиц, распределенных по нескольким БД (шардам) по хэшу ключевого столбца.
+    Каждый шард - отдельный AlternativeModelManager, таблица создается на всех шардах.
+    Подходит и для локальной проверки на нескольких файлах SQLite.
+    Отличия от AlternativeModelManager: read_changed_since принимает и возвращает список watermark по шардам,
+    search поддерживает только rank=False, сводки ведутся на каждом шарде и сводятся в read_summary'''
+
+    def __init__(self, shard_urls: List[str], node_id: int = None, node_lease: float = NODE_LEASE_SECONDS,
+                 **manager_options):
+        """
+        Args:
+            shard_urls: URL подключения к шардам, порядок шардов менять нельзя - по нему маршрутизируются ключи
+            node_id: Номер процесса-писателя (0-1023) для уникальности id. По умолчанию занимается первый
+                     свободный номер в таблице _id_nodes первого шарда. Номер арендуется: фоновый поток
+                     продлевает аренду, close() (и завершение процесса) освобождает номер. Номер процесса,
+                     который упал или потерял связь с первым шардом, освобождается через node_lease секунд
+                     на любом хосте, поэтому перезапуск с тем же node_id ждет истечения прежней аренды.
+                     Часы хостов должны расходиться много меньше чем на node_lease
+            node_lease: Срок аренды node_id в секундах, должен быть одинаковым у всех процессов
+            manager_options: Параметры AlternativeModelManager для каждого шарда (например statement_timeouts)
+        """
+        if not shard_urls or len(shard_urls) > MAX_SHARDS:
+            raise ValueError(f"Expected from 1 to {MAX_SHARDS} shard urls, got {len(shard_urls or [])}")
+        self.shards = [AlternativeModelManager(url, **manager_options) for url in shard_urls]
+        self._nodes = Table(NODES_TABLE, MetaData(),
+                            Column('node_id', Integer, primary_key=True, autoincrement=False),
+                            Column('host', String(255), nullable=False),
+                            Column('pid', Integer, nullable=False),
+                            Column('claimed_at', DateTime, nullable=False))
+        self._node_lease = node_lease
+        self._ids = _GlobalIds(self._claim_node_id(node_id))
+        self._ids.valid_until = self._lease_valid_until(time.monotonic())
+        self._lease_stopped = threading.Event()
+        self._lease_thread = threading.Thread(target=self._renew_lease, name='id-node-lease', daemon=True)
+        self._lease_thread.start()
+        atexit.register(self._release_node_id)
+        self._round_robin = itertools.count()
+        self._shard_keys: Dict[str, str] = {}  # кэш каталога шардированных таблиц
+        self._shard_key_types: Dict[str, type] = {}  # кэш python-типов столбцов ключа
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='shard')
+        self._catalog = Table(CATALOG_TABLE, MetaData(),
+                              Column('table_name', String(255), primary_key=True),
+                              Column('shard_key', String(255), nullable=False))
+        logger.info(f"Initialized ShardedModelManager with {len(self.shards)} shards")
+
+    def _claim_node_id(self, node_id: int = None) -> int:
+        """Занимает node_id в таблице _id_nodes первого шарда: запрошенный или первый свободный.
+        Номера с истекшей арендой считаются свободными независимо от хоста. Если запрошенный номер занят,
+        ждет истечения его аренды - так перезапуск после падения получает свой прежний номер.
+        Raises:
+            ValueError: Запрошенный номер занят продлеваемой арендой или свободных номеров нет"""
+        if node_id is not None and not 0 <= node_id < MAX_NODES:
+            raise ValueError(f"node_id must be from 0 to {MAX_NODES - 1}, got {node_id}")
+        engine = self.shards[0].engine
+        self._nodes.create(engine, checkfirst=True)
+        host, pid = socket.gethostname(), os.getpid()
+        # продлеваемая владельцем аренда не истекает - ждем не дольше одного срока аренды
+        deadline = time.monotonic() + self._node_lease
+        attempts = 0
+        while True:
+            try:
+                with engine.begin() as connection:
+                    expired_before = _utcnow() - timedelta(seconds=self._node_lease)
+                    connection.execute(delete(self._nodes).where(self._nodes.c.claimed_at < expired_before))
+                    owners = {row.node_id: row for row in connection.execute(select(self._nodes))}
+                    candidates = [node_id] if node_id is not None else range(MAX_NODES)
+                    free = next((candidate for candidate in candidates if candidate not in owners), None)
+                    if free is None and node_id is None:
+                        raise ValueError(f"All {MAX_NODES} node ids are in use, see table '{NODES_TABLE}'")
+                    if free is not None:
+                        connection.execute(insert(self._nodes).values(
+                            node_id=free, host=host, pid=pid, claimed_at=_utcnow()))
+            except IntegrityError:
+                attempts += 1  # номер одновременно занял другой процесс - перечитываем
+                if attempts >= CLAIM_ATTEMPTS:
+                    raise ValueError(f"Could not claim a node id after {CLAIM_ATTEMPTS} attempts")
+                continue
+            if free is not None:
+                logger.info(f"Claimed id node {free} for {host} pid {pid}")
+                return free
+            owner = owners[node_id]
+            if time.monotonic() >= deadline:
+                raise ValueError(f"node_id {node_id} is in use by {owner.host} pid {owner.pid}")
+            expires_in = max((owner.claimed_at - expired_before).total_seconds(), 0.0)
+            logger.info(f"node_id {node_id} is leased by {owner.host} pid {owner.pid}, waiting {expires_in:.1f}s")
+            time.sleep(min(expires_in + 0.05, max(deadline - time.monotonic(), 0.0)))
+
+    def _lease_valid_until(self, renewed_at: float) -> float:
+        """До какого момента (по time.monotonic()) можно выдавать id после продления аренды в renewed_at.
+        Половина срока - запас на расхождение часов: другие процессы займут номер только после всего срока"""
+        return renewed_at + self._node_lease / 2
+
+    def _renew_lease(self) -> None:
+        """Фоновый поток: продлевает аренду node_id, пока менеджер не закрыт"""
+        host, pid = socket.gethostname(), os.getpid()
+        while not self._lease_stopped.wait(self._node_lease / 4):
+            renewed_at = time.monotonic()
+            try:
+                with self.shards[0].engine.begin() as connection:
+                    renewed = connection.execute(self._nodes.update().where(
+                        self._nodes.c.node_id == self._ids.node_id, self._nodes.c.host == host,
+                        self._nodes.c.pid == pid).values(claimed_at=_utcnow())).rowcount
+            except Exception as e:
+                logger.warning(f"Could not renew lease of id node {self._ids.node_id}: {str(e)}")
+                continue
+            if not renewed:
+                # аренда истекла, и номер мог занять другой процесс - новые id больше не выдаются
+                logger.error(f"Lease of id node {self._ids.node_id} was lost, new records cannot be created")
+                return
+            self._ids.valid_until = self._lease_valid_until(renewed_at)
+
+    def _release_node_id(self) -> None:
+        """Останавливает продление аренды и освобождает node_id этого менеджера"""
+        atexit.unregister(self._release_node_id)
+        self._lease_stopped.set()
+        self._lease_thread.join()
+        self._ids.valid_until = 0.0
+        with self.shards[0].engine.begin() as connection:
+            connection.execute(delete(self._nodes).where(
+                self._nodes.c.node_id == self._ids.node_id, self._nodes.c.host == socket.gethostname(),
+                self._nodes.c.pid == os.getpid()))
+
+    def _fan_out(self, call: Callable[[AlternativeModelManager], Any], shards: List[int] = None) -> List[Any]:
+        """Параллельно выполняет call на шардах, результаты в порядке шардов"""
+        indexes = range(len(self.shards)) if shards is None else shards
+        futures = [self._executor.submit(call, self.shards[index]) for index in indexes]
+        return [future.result() for future in futures]
+
+    def _shard_key(self, table_name: str) -> str:
+        """Ключ шардирования таблицы из кэша или каталога на первом шарде"""
+        shard_key = self._shard_keys.get(table_name)
+        if shard_key is None:
+            catalog_shard = self.shards[0]
+            if catalog_shard._table_exists(CATALOG_TABLE):
+                with catalog_shard.engine.connect() as connection:
+                    shard_key = connection.execute(select(self._catalog.c.shard_key).where(
+                        self._catalog.c.table_name == table_name)).scalar()
+            if shard_key is None:
+                raise ValueError(f"Table '{table_name}' is not sharded")
+            self._shard_keys[table_name] = shard_key
+        return shard_key
+
+    def _shard_for_key(self, table_name: str, value: Any) -> int:
+        """Номер шарда по значению ключа - стабильный между процессами хэш (в отличие от hash()).
+        Значение приводится к python-типу столбца ключа, чтобы 42 и '42' попадали в один шард"""
+        python_type = self._shard_key_types.get(table_name)
+        if python_type is None:
+            column = self._get_model(table_name).__table__.c[self._shard_key(table_name)]
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = object
+            self._shard_key_types[table_name] = python_type
+        if value is not None and python_type in (bool, int, float, str):
+            value = python_type(value)
+        return zlib.crc32(repr(value).encode()) % len(self.shards)
+
+    def _route_new_row(self, table_name: str, data: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Выбирает шард для новой строки и присваивает ей глобальный id"""
+        shard_key = self._shard_key(table_name)
+        if shard_key == 'id':
+            shard_index = next(self._round_robin) % len(self.shards)  # id еще нет - раскладываем по кругу
+        else:
+            if shard_key not in data:
+                raise ValueError(f"Shard key '{shard_key}' is required to insert into '{table_name}'")
+            shard_index = self._shard_for_key(table_name, data[shard_key])
+        return shard_index, {**data, 'id': self._ids.next_id(shard_index)}
+
+    def _shard_for_id(self, record_id: int) -> AlternativeModelManager:
+        shard_index = shard_of_id(record_id)
+        if shard_index >= len(self.shards):
+            raise ValueError(f"Record id {record_id} points to unknown shard {shard_index}")
+        return self.shards[shard_index]
+
+    def create_model(self, table_name: str, columns_config: Dict[str, Any], shard_key: str = 'id',
+                     **options) -> List[Any]:
+        """Создает таблицу на всех шардах и регистрирует ключ шардирования.
+        Args:
+            shard_key: Столбец, по хэшу которого строки распределяются по шардам
+            options: Остальные параметры AlternativeModelManager.create_model
+        Returns:
+            Модели по шардам"""
+        if shard_key != 'id' and shard_key not in columns_config:
+            raise ValueError(f"Shard key '{shard_key}' is not in columns_config")
+        catalog_shard = self.shards[0]
+        self._catalog.create(catalog_shard.engine, checkfirst=True)
+        models = self._fan_out(lambda shard: shard.create_model(
+            table_name, columns_config, id_type=BigInteger, **options))
+        with catalog_shard.engine.begin() as connection:
+            connection.execute(insert(self._catalog).values(table_name=table_name, shard_key=shard_key))
+        self._shard_keys[table_name] = shard_key
+        logger.info(f"Created sharded table '{table_name}' on {len(self.shards)} shards by '{shard_key}'")
+        return models
+
+    def _get_model(self, table_name: str, columns_config: Dict[str, Any] = None) -> Any:
+        """Модель шардированной таблицы - схема на всех шардах одна, модель берется с первого"""
+        self._shard_key(table_name)
+        return self.shards[0]._get_model(table_name)
+
+    def create_record(self, table_name: str, data: Dict[str, Any]) -> Any:
+        """Создает запись на шарде, выбранном по ключу шардирования"""
+        shard_index, data = self._route_new_row(table_name, self.shards[0]._as_dict(data))
+        return self.shards[shard_index].create_record(table_name, data)
+
+    def create_records(self, table_name: str, rows: List[Dict[str, Any]]) -> List[int]:
+        """Пакетно создает записи: строки группируются по шардам, шарды пишутся параллельно,
+        каждый шард - одной транзакцией. Атомарна запись каждого шарда, но не всего пакета.
+        Returns:
+            id созданных записей в порядке rows
+        Raises:
+            PartialWriteError: Часть шардов записана, а часть нет - в ошибке id записанных строк"""
+        # строки проверяются до записи: ошибка в данных не должна оставить часть шардов записанными
+        columns = set(self._get_model(table_name).__table__.c.keys())
+        by_shard: Dict[int, List[int]] = {}
+        prepared = []
+        for position, row in enumerate(rows):
+            row = self.shards[0]._as_dict(row)
+            unknown = set(row) - columns
+            if unknown:
+                raise ValueError(f"Unknown columns for '{table_name}': {sorted(unknown)}")
+            shard_index, row = self._route_new_row(table_name, row)
+            by_shard.setdefault(shard_index, []).append(position)
+            prepared.append(row)
+        futures = {shard_index: self._executor.submit(self.shards[shard_index].create_records, table_name,
+                                                      [prepared[position] for position in positions])
+                   for shard_index, positions in by_shard.items()}
+        errors = {shard_index: future.exception() for shard_index, future in futures.items()}
+        errors = {shard_index: error for shard_index, error in errors.items() if error is not None}
+        if not errors:
+            return [row['id'] for row in prepared]
+        if len(errors) == len(futures):
+            raise next(iter(errors.values()))  # ни один шард не записан - как обычная ошибка create_records
+        failed = {position: error for shard_index, error in errors.items() for position in by_shard[shard_index]}
+        raise PartialWriteError(
+            f"Records for '{table_name}' were written to shards {sorted(set(futures) - set(errors))}, "
+            f"shards {sorted(errors)} failed: {next(iter(errors.values()))}",
+            [None if position in failed else row['id'] for position, row in enumerate(prepared)], failed)
+
+    def run_concurrently(self, ops: List[Union[Callable[[], Any], Tuple]], max_workers: int = None,
+                         return_exceptions: bool = False) -> List[Any]:
+        """Выполняет независимые операции в пуле потоков (см. AlternativeModelManager.run_concurrently),
+        по умолчанию потоков столько, сколько соединений у всех шардов вместе.
+        Операции-кортежи (имя_метода, args[, kwargs]) выполняются методами этого менеджера, а не одного шарда"""
+        calls = []
+        for op in ops:
+            if callable(op):
+                calls.append(op)
+                continue
+            method_name, args, kwargs = (tuple(op) + ({},))[:3]
+            method = getattr(self, method_name)
+            calls.append(lambda method=method, args=args, kwargs=kwargs: method(*args, **kwargs))
+        capacity = sum(shard._pool_capacity() for shard in self.shards)
+        return self.shards[0].run_concurrently(calls, max_workers or capacity, return_exceptions)
+
+    def read(self, table_name: str, record_id: int, compact: bool = False) -> Optional[Any]:
+        return self._shard_for_id(record_id).read(table_name, record_id, compact=compact)
+
+    def update(self, table_name: str, record_id: int, data: Dict[str, Any]) -> Optional[Any]:
+        """Обновляет запись на ее шарде. Ключ шардирования менять нельзя - строка осталась бы на чужом шарде.
+        Компактная строка содержит ключ целиком, поэтому ключ в данных допустим, если он совпадает с сохраненным"""
+        shard_key = self._shard_key(table_name)
+        shard = self._shard_for_id(record_id)
+        data = shard._as_dict(data)  # в кортеже `in` проверял бы значения, а не имена столбцов
+        if shard_key != 'id' and shard_key in data:
+            current = shard.read(table_name, record_id)
+            if current is not None and getattr(current, shard_key) != data[shard_key]:
+                raise ValueError(f"Shard key '{shard_key}' of '{table_name}' cannot be updated")
+        return shard.update(table_name, record_id, data)
+
+    def delete(self, table_name: str, record_id: int) -> bool:
+        return self._shard_for_id(record_id).delete(table_name, record_id)
+
+    def read_all(self, table_name: str, filters: Dict[str, Any] = None, compact: bool = False) -> List[Any]:
+        """Читает записи со всех шардов параллельно. Если в фильтрах есть равенство
+        по ключу шардирования - читает только его шард. Результат упорядочен по id"""
+        shard_key = self._shard_key(table_name)
+        shards = None
+        if filters and shard_key != 'id' and shard_key in filters and not isinstance(filters[shard_key], tuple):
+            shards = [self._shard_for_key(table_name, filters[shard_key])]
+        results = self._fan_out(lambda shard: shard.read_all(table_name, filters, compact=compact), shards)
+        return sorted((row for rows in results for row in rows), key=lambda row: row.id)
+
+    def read_changed_since(self, table_name: str, watermarks: List[Any] = None, limit: int = 1000,
+                           safety_lag: float = None) -> Tuple[List[Any], List[Any]]:
+        """Лента изменений со всех шардов (см. AlternativeModelManager.read_changed_since).
+        Часы и транзакции разных БД не упорядочены между собой, поэтому watermark ведется для каждого шарда.
+        Args:
+            watermarks: None для чтения с начала, иначе список watermark по шардам из прошлого вызова
+        Returns:
+            (записи в порядке (updated_at, id), список watermark по шардам)"""
+        self._shard_key(table_name)
+        watermarks = list(watermarks) if watermarks is not None else [None] * len(self.shards)
+        if len(watermarks) != len(self.shards):
+            raise ValueError(f"Expected {len(self.shards)} watermarks, one per shard, got {len(watermarks)}")
+        futures = [self._executor.submit(shard.read_changed_since, table_name, watermark, limit, safety_lag)
+                   for shard, watermark in zip(self.shards, watermarks)]
+        changes = [(change, index) for index, future in enumerate(futures) for change in future.result()[0]]
+        changes.sort(key=lambda item: (getattr(item[0], UPDATED_AT), item[0].id))
+        changes = changes[:limit]
+        # у каждого шарда отдан префикс его изменений - его watermark сдвигается до последнего отданного
+        for change, index in changes:
+            watermarks[index] = (getattr(change, UPDATED_AT), change.id)
+        return [change for change, _ in changes], watermarks
+
+    def search(self, table_name: str, query: str, limit: int = 20, rank: bool = True) -> List[Any]:
+        """Полнотекстовый поиск на всех шардах, результат упорядочен по id.
+        Релевантность шардов несравнима (bm25 зависит от статистики своего шарда), поэтому только rank=False"""
+        self._shard_key(table_name)
+        if rank:
+            raise ValueError(f"Ranked search is not supported on sharded table '{table_name}', use rank=False")
+        results = self._fan_out(lambda shard: shard.search(table_name, query, limit, rank=False))
+        return sorted((row for rows in results for row in rows), key=lambda row: row.id)[:limit]
+
+    def aggregate(self, table_name: str, aggregates: Dict[str, Tuple[str, str]],
+                  filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Считает агрегаты на каждом шарде параллельно и сводит их.
+        avg собирается из сумм и количеств шардов, а не из средних"""
+        self._shard_key(table_name)
+        shard_aggregates = {}
+        for alias, (function, column_name) in aggregates.items():
+            if function == 'avg':
+                shard_aggregates[f'{alias}__sum'] = ('sum', column_name)
+                shard_aggregates[f'{alias}__count'] = ('count', column_name)
+            else:
+                shard_aggregates[alias] = (function, column_name)
+        results = self._fan_out(lambda shard: shard.aggregate(table_name, shard_aggregates, filters))
+        merged = {}
+        for alias, (function, _) in aggregates.items():
+            if function == 'avg':
+                total = sum(result[f'{alias}__sum'] or 0 for result in results)
+                count = sum(result[f'{alias}__count'] for result in results)
+                merged[alias] = total / count if count else None
+                continue
+            values = [result[alias] for result in results if result[alias] is not None]
+            if function == 'count':
+                merged[alias] = sum(values)
+            elif function == 'sum':
+                merged[alias] = sum(values) if values else None
+            else:
+                merged[alias] = (min if function == 'min' else max)(values) if values else None
+        return merged
+
+    def create_summary(self, source_table: str, group_by: List[str], aggregates: Dict[str, Tuple[str, str]],
+                       summary_table: str = None) -> str:
+        """Создает сводку на каждом шарде (см. AlternativeModelManager.create_summary):
+        сводку шарда поддерживают записи в этот шард, read_summary сводит их"""
+        self._shard_key(source_table)
+        return self._fan_out(lambda shard: shard.create_summary(source_table, group_by, aggregates, summary_table))[0]
+
+    def rebuild_summary(self, summary_table: str) -> int:
+        """Пересчитывает сводку на всех шардах.
+        Returns:
+            Число групп после сведения шардов"""
+        self._fan_out(lambda shard: shard.rebuild_summary(summary_table))
+        return len(self.read_summary(summary_table))
+
+    def read_summary(self, summary_table: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Сводит сводки шардов по group_key: row_count, count и sum складываются,
+        avg вычисляется из общих суммы и количества"""
+        results = self._fan_out(lambda shard: shard._read_summary_rows(summary_table, filters))
+        summary = results[0][0]
+        merged: Dict[str, Dict[str, Any]] = {}
+        for _, rows in results:
+            for values in rows:
+                group = merged.get(values[GROUP_KEY])
+                if group is None:
+                    merged[values[GROUP_KEY]] = values
+                    continue
+                for name, value in values.items():
+                    if name != GROUP_KEY and name not in summary['group_by']:
+                        group[name] += value
+        return [self.shards[0]._summary_result(summary, values) for values in merged.values()]
+
+    def ensure_partitions(self, table_name: str, ahead: int = 3, since: datetime = None) -> List[str]:
+        """Создает партиции на всех шардах (см. AlternativeModelManager.ensure_partitions).
+        Returns:
+            Имена партиций, созданных хотя бы на одном шарде"""
+        self._shard_key(table_name)
+        results = self._fan_out(lambda shard: shard.ensure_partitions(table_name, ahead, since))
+        return sorted({partition for partitions in results for partition in partitions})
+
+    def drop_partitions_older_than(self, table_name: str, cutoff: datetime) -> List[str]:
+        """Удаляет старые партиции на всех шардах (см. AlternativeModelManager.drop_partitions_older_than).
+        Returns:
+            Имена партиций, удаленных хотя бы на одном шарде"""
+        self._shard_key(table_name)
+        results = self._fan_out(lambda shard: shard.drop_partitions_older_than(table_name, cutoff))
+        return sorted({partition for partitions in results for partition in partitions})
+
+    def purge(self, table_name: str, filters: Dict[str, Any] = None, start_after: Union[int, List[Any]] = 0,
+              progress: Callable[[Dict[str, Any]], Any] = None, **options) -> Dict[str, Any]:
+        """Порционная очистка на всех шардах параллельно, см. AlternativeModelManager.purge.
+        Каждый шард останавливается на своем last_id, поэтому и продолжать очистку нужно с позиции каждого шарда.
+        Args:
+            start_after: 0 - с начала, для продолжения - список 'shards' из результата (или last_id по шардам)
+            progress: Вызывается после каждой порции любого шарда, в словаре прогресса есть номер 'shard'
+        Returns:
+            {'deleted': всего удалено, 'shards': прогресс по шардам}"""
+        self._shard_key(table_name)
+        if isinstance(start_after, int):
+            if start_after:
+                raise ValueError("Sharded purge resumes per shard: pass result['shards'] as start_after")
+            start_after = [0] * len(self.shards)
+        start_after = [state['last_id'] if isinstance(state, dict) else state for state in start_after]
+        if len(start_after) != len(self.shards):
+            raise ValueError(f"Expected {len(self.shards)} start positions, one per shard, got {len(start_after)}")
+        futures = [self._executor.submit(
+            shard.purge, table_name, filters, start_after=shard_start,
+            progress=(lambda state, index=index: progress({'shard': index, **state})) if progress else None,
+            **options) for index, (shard, shard_start) in enumerate(zip(self.shards, start_after))]
+        results = [future.result() for future in futures]
+        return {'deleted': sum(result['deleted'] for result in results), 'shards': results}
+
+    def delete_table(self, table_name: str) -> bool:
+        """Удаляет таблицу на всех шардах и из каталога"""
+        self._shard_key(table_name)
+        results = self._fan_out(lambda shard: shard.delete_table(table_name))
+        with self.shards[0].engine.begin() as connection:
+            connection.execute(self._catalog.delete().where(self._catalog.c.table_name == table_name))
+        self._shard_keys.pop(table_name, None)
+        self._shard_key_types.pop(table_name, None)
+        return all(results)
+
+    def close(self) -> None:
+        """Освобождает node_id, останавливает пул потоков и закрывает соединения шардов"""
+        self._release_node_id()
+        self._executor.shutdown()
+        for shard in self.shards:
+            shard.engine.dispose()
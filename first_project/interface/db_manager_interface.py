@@ -2,7 +2,11 @@ from db_tools.alternative import  AlternativeModelManager
 from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, MetaData
 from db_tools.db_manager import DynamicModelManager
 from db_tools.alternative import AlternativeModelManager
+from db_tools.sharding import ShardedModelManager
+from db_tools.admission import AdmissionController
+from contextlib import nullcontext
 from datetime import datetime
+from typing import Dict, List
 import logging
 from configuration.db_url_config import _create_db_url # для генерации db_url
 
@@ -15,59 +19,170 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class DBManagerInterface:
-    def __init__(self,db_url):
-        self.db_manager = AlternativeModelManager(db_url)
+    def __init__(self,db_url=None,shard_urls:List[str]=None,statement_timeouts:Dict[str,int]=None,
+                 limits:Dict[str,int]=None,max_queue:Dict[str,int]=None,queue_timeout:float=None):
+        """statement_timeouts - таймауты запросов в мс по типам операций read/write/ddl (PostgreSQL);
+        limits, max_queue, queue_timeout - лимиты конкурентности по тем же типам, см. AdmissionController"""
+        # при переданных shard_urls таблицы распределяются по нескольким БД
+        if shard_urls:
+            self.db_manager = ShardedModelManager(shard_urls, statement_timeouts=statement_timeouts)
+        else:
+            self.db_manager = AlternativeModelManager(db_url, statement_timeouts=statement_timeouts)
+        self.admission = AdmissionController(limits, max_queue, queue_timeout) if limits else None
 
-    def create_model(self,table_name:str,columns_config:dict):
+    def _admit(self, kind: str):
+        """Допуск операции через ограничитель конкурентности, если он настроен"""
+        return self.admission.admit(kind) if self.admission else nullcontext()
+
+    def admission_metrics(self) -> dict:
+        """Метрики ограничителя: допущено, отклонено, время в очереди по типам операций"""
+        return self.admission.metrics() if self.admission else {}
+
+    def create_model(self,table_name:str,columns_config:dict,partition_by:Dict[str,str]=None,
+                     track_changes:bool=False,tombstones:str=None,searchable:List[str]=None,shard_key:str=None):
             logger.info(f'процесс создания таблицы {table_name} запущен')
-            db_model = self.db_manager.create_model(table_name,columns_config)
+            options = {'shard_key': shard_key} if shard_key else {}  # только для шардированного режима
+            with self._admit('ddl'):
+                db_model = self.db_manager.create_model(table_name,columns_config,partition_by=partition_by,
+                                                        track_changes=track_changes,tombstones=tombstones,
+                                                        searchable=searchable,**options)
             logger.info(f'процесс создания таблицы {table_name} завершен')
             return db_model
     
     def get_model(self,table_name:str):
          logger.info(f'процесс поиска таблицы {table_name} запущен')
-         db_model = self.db_manager._get_model(table_name)
+         with self._admit('read'):
+             db_model = self.db_manager._get_model(table_name)
          logger.info(f'процесс поиска таблицы {table_name} завершен')
          return db_model
     
     def create_record(self, table_name: str, data: dict):
         logger.info(f'процесс создани строки в таблице  {table_name} запущен')
-        db_record = self.db_manager.create_record(table_name,data)
+        with self._admit('write'):
+            db_record = self.db_manager.create_record(table_name,data)
         logger.info(f'процесс создания строки в таблице {table_name} завершен')
         return db_record
     
-    def read(self, table_name: str, record_id: int):
+    def create_records(self, table_name: str, rows: List[dict]) -> List[int]:
+        logger.info(f'процесс пакетного создания {len(rows)} строк в таблице {table_name} запущен')
+        with self._admit('write'):
+            ids = self.db_manager.create_records(table_name, rows)
+        logger.info(f'процесс пакетного создания строк в таблице {table_name} завершен')
+        return ids
+
+    def read(self, table_name: str, record_id: int, compact: bool = False):
         logger.info(f'процесс чтения строки в таблице  {table_name} запущен')
-        db_record = self.db_manager.read(table_name,record_id)
+        with self._admit('read'):
+            db_record = self.db_manager.read(table_name,record_id,compact=compact)
         logger.info(f'процесс чтения строки в таблице {table_name} завершен')
         return db_record
     
-    def read_all(self,table_name):
+    def read_all(self,table_name,filters:dict=None,compact:bool=False):
         logger.info(f'процесс чтения всех строк из таблицы {table_name} запущен')
-        db_record = self.db_manager.read_all(table_name)
+        with self._admit('read'):
+            db_record = self.db_manager.read_all(table_name,filters,compact=compact)
         logger.info(f'процесс чтения всех строк из таблицы {table_name} завершен')
         return db_record
     
+    def read_changed_since(self, table_name: str, watermark=None, limit: int = 1000, safety_lag: float = None):
+        logger.info(f'процесс чтения изменений таблицы {table_name} после {watermark} запущен')
+        with self._admit('read'):
+            changes, next_watermark = self.db_manager.read_changed_since(table_name, watermark, limit, safety_lag)
+        logger.info(f'процесс чтения изменений таблицы {table_name} завершен, получено {len(changes)} записей')
+        return changes, next_watermark
+
     def update(self, table_name: str, record_id: int, data: dict):
         logger.info(f'процесс обнволения строки таблицы {table_name} с  id {record_id }запущен')
-        db_record = self.db_manager.update(table_name,record_id,data)
+        with self._admit('write'):
+            db_record = self.db_manager.update(table_name,record_id,data)
         logger.info(f'процесс обнволения строки таблицы {table_name} с  id {record_id }завершен')
         return db_record
     
     def delete(self, table_name: str, record_id: int):
         logger.info(f'процесс удаления строки таблицы {table_name} с  id {record_id }запущен')
-        db_record = self.db_manager.delete(table_name,record_id)
+        with self._admit('write'):
+            db_record = self.db_manager.delete(table_name,record_id)
         if db_record:
             logger.info(f'процесс удаления строки таблицы {table_name} с  id {record_id }завершен')
             return db_record
         return logger.info(f'Что то пошло не так при удалении записи из ьаблицы {table_name}')
     
+    def search(self, table_name: str, query: str, limit: int = 20, rank: bool = True) -> list:
+        logger.info(f'процесс поиска "{query}" по таблице {table_name} запущен')
+        with self._admit('read'):
+            results = self.db_manager.search(table_name, query, limit, rank)
+        logger.info(f'процесс поиска по таблице {table_name} завершен, найдено {len(results)} записей')
+        return results
+
+    def aggregate(self, table_name: str, aggregates: dict, filters: dict = None) -> dict:
+        logger.info(f'процесс подсчета агрегатов {list(aggregates)} по таблице {table_name} запущен')
+        with self._admit('read'):
+            result = self.db_manager.aggregate(table_name, aggregates, filters)
+        logger.info(f'процесс подсчета агрегатов по таблице {table_name} завершен')
+        return result
+
+    def create_summary(self, source_table: str, group_by: List[str], aggregates: dict, summary_table: str = None) -> str:
+        logger.info(f'процесс создания сводки по таблице {source_table} с группировкой {group_by} запущен')
+        with self._admit('ddl'):
+            summary_table = self.db_manager.create_summary(source_table, group_by, aggregates, summary_table)
+        logger.info(f'процесс создания сводки {summary_table} завершен')
+        return summary_table
+
+    def rebuild_summary(self, summary_table: str) -> int:
+        logger.info(f'процесс пересчета сводки {summary_table} запущен')
+        with self._admit('write'):
+            groups = self.db_manager.rebuild_summary(summary_table)
+        logger.info(f'процесс пересчета сводки {summary_table} завершен, групп: {groups}')
+        return groups
+
+    def read_summary(self, summary_table: str, filters: dict = None) -> List[dict]:
+        logger.info(f'процесс чтения сводки {summary_table} запущен')
+        with self._admit('read'):
+            rows = self.db_manager.read_summary(summary_table, filters)
+        logger.info(f'процесс чтения сводки {summary_table} завершен')
+        return rows
+
+    def purge(self, table_name: str, filters: dict = None, batch_size: int = 1000, sleep_between: float = 0.0,
+              archive_to: str = None, start_after: int = 0, progress=None, hard_delete: bool = False) -> dict:
+        logger.warning(f'процесс очистки таблицы {table_name} по фильтрам {filters} запущен')
+        # допуск берется на каждую порцию, а не на всю очистку с паузами - иначе она надолго занимает бюджет записи
+        result = self.db_manager.purge(table_name, filters, batch_size=batch_size, sleep_between=sleep_between,
+                                       archive_to=archive_to, start_after=start_after, progress=progress,
+                                       chunk_context=lambda: self._admit('write'), hard_delete=hard_delete)
+        logger.warning(f'процесс очистки таблицы {table_name} завершен: {result}')
+        return result
+
+    def run_concurrently(self, ops, max_workers: int = None, return_exceptions: bool = False) -> list:
+        logger.info(f'процесс параллельного выполнения операций запущен')
+        # операции-кортежи выполняем через методы интерфейса, чтобы они проходили через ограничитель
+        calls = [op if callable(op) else
+                 (lambda name=op[0], args=op[1], kwargs=(op[2] if len(op) > 2 else {}): getattr(self, name)(*args, **kwargs))
+                 for op in ops]
+        results = self.db_manager.run_concurrently(calls, max_workers, return_exceptions)
+        logger.info(f'процесс параллельного выполнения {len(results)} операций завершен')
+        return results
+
+    def ensure_partitions(self, table_name: str, ahead: int = 3, since: datetime = None) -> List[str]:
+        logger.info(f'процесс создания партиций таблицы {table_name} на {ahead} периодов вперед запущен')
+        with self._admit('ddl'):
+            partitions = self.db_manager.ensure_partitions(table_name, ahead, since)
+        logger.info(f'процесс создания партиций таблицы {table_name} завершен, созданы: {partitions}')
+        return partitions
+
+    def drop_partitions_older_than(self, table_name: str, cutoff: datetime) -> List[str]:
+        logger.warning(f'процесс удаления партиций таблицы {table_name} старше {cutoff} запущен')
+        with self._admit('ddl'):
+            partitions = self.db_manager.drop_partitions_older_than(table_name, cutoff)
+        logger.warning(f'процесс удаления партиций таблицы {table_name} завершен, удалены: {partitions}')
+        return partitions
+
     def __delete_table(self, table_name: str):
         logger.info(f"вы собираетесь удалить таблицу {table_name}, подтвердите действие")
         confirmation = input()
         if confirmation.lower() in ['yes','да','Леха лох']:
             logger.warning(f'процесс удаления таблицы {table_name} запущен')
-            db_record = self.db_manager.delete_table(table_name)
+            with self._admit('ddl'):
+                db_record = self.db_manager.delete_table(table_name)
             logger.warning(f'процесс удаления таблицы {table_name} завершен ')
             return db_record
         return f"удаление таблицы {table_name} отменено"
\ No newline at end of file
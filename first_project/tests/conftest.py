@@ -0,0 +1,33 @@
+'''Проверки на файлах SQLite, запуск из first_project: python -m pytest tests'''
+import logging
+import os
+import sys
+
+import pytest
+
+# модули проекта импортируются от first_project, как в main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_tools.alternative import AlternativeModelManager  # noqa: E402
+from db_tools.sharding import ShardedModelManager  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = AlternativeModelManager(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    yield manager
+    manager.engine.dispose()
+
+
+@pytest.fixture
+def shard_urls(tmp_path):
+    return [f"sqlite:///{tmp_path / f'shard{index}.sqlite'}" for index in range(3)]
+
+
+@pytest.fixture
+def sharded(shard_urls):
+    sharded = ShardedModelManager(shard_urls)
+    yield sharded
+    sharded.close()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import Integer, String
+
+from db_tools.admission import AdmissionController, AdmissionRejected
+from interface.db_manager_interface import DBManagerInterface
+
+
+def hold(controller, kind):
+    """Занимает слот kind в отдельном потоке, возвращает событие для его освобождения"""
+    entered, release = threading.Event(), threading.Event()
+
+    def run():
+        with controller.admit(kind):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    entered.wait(5)
+    return release, thread
+
+
+def test_fail_fast_rejects_when_budget_is_exhausted():
+    controller = AdmissionController({'write': 1})
+    release, thread = hold(controller, 'write')
+    with pytest.raises(AdmissionRejected):
+        with controller.admit('write'):
+            pass
+    with controller.admit('read'):  # тип без лимита не ограничивается
+        pass
+    release.set()
+    thread.join()
+    with controller.admit('write'):
+        pass
+    metrics = controller.metrics()['write']
+    assert (metrics['admitted'], metrics['rejected'], metrics['in_flight']) == (2, 1, 0)
+
+
+def test_bounded_queue_waits_and_times_out():
+    controller = AdmissionController({'read': 1}, max_queue={'read': 1}, queue_timeout=0.2)
+    release, thread = hold(controller, 'read')
+    with pytest.raises(AdmissionRejected):  # ждал в очереди дольше queue_timeout
+        with controller.admit('read'):
+            pass
+    # слот освобождается, пока операция ждет в очереди - она допускается
+    threading.Timer(0.05, release.set).start()
+    with controller.admit('read'):
+        pass
+    thread.join()
+    metrics = controller.metrics()['read']
+    assert (metrics['admitted'], metrics['rejected'], metrics['timed_out'], metrics['queued']) == (2, 1, 1, 2)
+    assert metrics['queue_time_max_ms'] >= 150
+
+
+def test_full_queue_rejects_without_waiting():
+    controller = AdmissionController({'ddl': 1}, max_queue={'ddl': 1}, queue_timeout=5)
+    release, holder = hold(controller, 'ddl')
+    def wait_in_queue():
+        with controller.admit('ddl'):
+            pass
+
+    waiter = threading.Thread(target=wait_in_queue)
+    waiter.start()
+    while controller.metrics()['ddl']['waiting'] < 1:
+        time.sleep(0.01)
+    with pytest.raises(AdmissionRejected):
+        with controller.admit('ddl'):
+            pass
+    assert controller.metrics()['ddl']['timed_out'] == 0
+    release.set()
+    holder.join()
+    waiter.join()
+    assert controller.metrics()['ddl']['admitted'] == 2
+
+
+def test_purge_releases_write_slot_between_chunks(tmp_path):
+    interface = DBManagerInterface(f"sqlite:///{tmp_path / 'db.sqlite'}", limits={'write': 1})
+    interface.create_model('events', {'name': String(20), 'value': Integer})
+    interface.create_records('events', [{'name': 'old', 'value': value} for value in range(6)])
+    written = []
+
+    def between_chunks(state):
+        # при fail-fast запись отклонилась бы, если бы очистка держала слот записи между порциями
+        written.append(interface.create_record('events', {'name': 'new', 'value': 100 + state['batches']}).id)
+
+    result = interface.purge('events', {'name': 'old'}, batch_size=2, progress=between_chunks)
+    assert result['batches'] == 3 and len(written) == 3
+    assert interface.admission_metrics()['write']['rejected'] == 0
+    interface.db_manager.engine.dispose()
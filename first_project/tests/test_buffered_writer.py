@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from sqlalchemy import Integer, String
+from sqlalchemy.exc import IntegrityError
+
+from db_tools.buffered_writer import BufferedWriter
+
+
+@pytest.fixture
+def events(manager):
+    manager.create_model('events', {'name': String(20), 'value': Integer})
+    batches = []
+    create_records = manager.create_records
+
+    def recording_create_records(table_name, rows):
+        batches.append(len(rows))
+        return create_records(table_name, rows)
+
+    manager.create_records = recording_create_records
+    return manager, batches
+
+
+def test_rows_are_inserted_in_batches(events):
+    manager, batches = events
+    with BufferedWriter(manager, 'events', max_batch=50, max_delay_ms=200) as writer:
+        futures = [writer.submit({'name': f'e{index}', 'value': index}) for index in range(120)]
+        ids = [future.result(timeout=5) for future in futures]
+    assert len(set(ids)) == 120
+    assert max(batches) > 1 and max(batches) <= 50
+    assert {row.value for row in manager.read_all('events')} == set(range(120))
+
+
+def test_failed_row_does_not_fail_its_batch(events):
+    manager, batches = events
+    existing_id = manager.create_records('events', [{'name': 'existing', 'value': 0}])[0]
+    batches.clear()
+    rows = [{'name': 'ok1', 'value': 1}, {'name': 'bad', 'unknown': 1}, {'name': 'ok2', 'value': 2},
+            {'id': existing_id, 'name': 'duplicate', 'value': 3}, {'name': 'ok3', 'value': 4}]
+    with BufferedWriter(manager, 'events', max_batch=10, max_delay_ms=500) as writer:
+        futures = [writer.submit(row) for row in rows]
+    assert batches[0] == len(rows)  # строки ушли одним пакетом, потом повторены по одной
+    with pytest.raises(ValueError):
+        futures[1].result()
+    with pytest.raises(IntegrityError):
+        futures[3].result()
+    assert all(isinstance(futures[index].result(), int) for index in (0, 2, 4))
+    assert sorted(row.name for row in manager.read_all('events')) == ['existing', 'ok1', 'ok2', 'ok3']
+
+
+def test_close_flushes_buffer_and_rejects_new_rows(events):
+    manager, _ = events
+    writer = BufferedWriter(manager, 'events', max_batch=1000, max_delay_ms=10000)
+    done = []
+    for index in range(10):
+        writer.submit({'name': 'e', 'value': index}, callback=done.append)
+    writer.close()
+    assert len(done) == 10 and len(manager.read_all('events')) == 10
+    with pytest.raises(RuntimeError):
+        writer.submit({'name': 'late', 'value': 0})
+
+
+def test_submit_async(events):
+    manager, _ = events
+
+    async def submit_all(writer):
+        return await asyncio.gather(*[writer.submit_async({'name': 'a', 'value': index}) for index in range(20)])
+
+    with BufferedWriter(manager, 'events', max_batch=8, max_delay_ms=20, max_buffer=4) as writer:
+        ids = asyncio.run(submit_all(writer))
+    assert len(set(ids)) == 20
+
+
+def test_sharded_batch_is_not_written_twice(sharded):
+    sharded.create_model('events', {'name': String(20), 'value': Integer}, shard_key='name')
+    rows = [{'name': f'e{index}', 'value': index} for index in range(6)]
+    with BufferedWriter(sharded, 'events', max_batch=10, max_delay_ms=500) as writer:
+        futures = [writer.submit(row) for row in rows + [{'name': 'bad', 'unknown': 1}]]
+    with pytest.raises(ValueError):
+        futures[-1].result()
+    assert sorted(row.value for row in sharded.read_all('events')) == list(range(6))
+
+    # шард без таблицы: остальные шарды записаны, повторяются только строки упавшего
+    failing = sharded._shard_for_key('events', 'f0')
+    sharded.shards[failing].delete_table('events')
+    rows = [{'name': f'f{index}', 'value': 100 + index} for index in range(12)]
+    with BufferedWriter(sharded, 'events', max_batch=20, max_delay_ms=500) as writer:
+        futures = [writer.submit(row) for row in rows]
+    written = [row for row, future in zip(rows, futures) if future.exception() is None]
+    assert all(sharded._shard_for_key('events', row['name']) != failing for row in written)
+    assert len(written) < len(rows)
+    stored = [row.value for index, shard in enumerate(sharded.shards) if index != failing
+              for row in shard.read_all('events') if row.value >= 100]
+    assert sorted(stored) == sorted(row['value'] for row in written)
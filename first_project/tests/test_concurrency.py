@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import Integer, String, create_engine
+
+ITEMS = {'name': String(20), 'value': Integer}
+
+
+def limit_pool(manager, size):
+    """Пул из size соединений без overflow: вложенное взятие соединения упирается в pool_timeout"""
+    manager.engine.dispose()
+    manager.engine = create_engine(manager.database_url, pool_size=size, max_overflow=0, pool_timeout=1)
+    manager.Session.configure(bind=manager.engine)
+
+
+@pytest.mark.parametrize('tombstones', [None, 'soft', 'table'])
+def test_every_operation_needs_one_connection(manager, tombstones):
+    manager.create_model('items', ITEMS, tombstones=tombstones, track_changes=True, searchable=['name'])
+    summary = manager.create_summary('items', ['name'], {'total': ('sum', 'value')})
+    limit_pool(manager, 1)
+    record_id = manager.create_record('items', {'name': 'tea', 'value': 1}).id
+    ids = manager.create_records('items', [{'name': 'coffee', 'value': value} for value in range(5)])
+    manager.update('items', record_id, {'value': 2})
+    assert manager.read('items', record_id).value == 2
+    assert len(manager.read_all('items', compact=True)) == 6
+    assert manager.aggregate('items', {'rows': ('count', '*')}) == {'rows': 6}
+    assert [row.name for row in manager.search('items', 'tea')] == ['tea']
+    assert manager.delete('items', ids[0])
+    manager.read_changed_since('items', safety_lag=0)
+    assert manager.purge('items', {'value': ('<', 3)}, batch_size=2)['deleted'] >= 2
+    assert manager.rebuild_summary(summary) == len(manager.read_summary(summary))
+
+
+def test_run_concurrently_at_pool_capacity(manager):
+    manager.create_model('items', ITEMS, tombstones='table')
+    manager.create_summary('items', ['name'], {'total': ('sum', 'value')})
+    ids = manager.create_records('items', [{'name': 'tea', 'value': value} for value in range(8)])
+    limit_pool(manager, 2)
+    assert manager.run_concurrently([('delete', ('items', record_id)) for record_id in ids]) == [True] * 8
+    assert manager.read_all('items') == []
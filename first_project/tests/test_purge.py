@@ -0,0 +1,36 @@
+from sqlalchemy import Integer, String
+
+EVENTS = {'name': String(20), 'value': Integer}
+
+
+def make_events(manager, tombstones, count=6):
+    manager.create_model('events', EVENTS, tombstones=tombstones)
+    return manager.create_records('events', [{'name': f'e{value}', 'value': value} for value in range(count)])
+
+
+def test_soft_purge_marks_rows_and_feeds_changes(manager):
+    ids = make_events(manager, 'soft')
+    _, watermark = manager.read_changed_since('events', safety_lag=0)
+    assert manager.purge('events', {'value': ('<', 4)}, batch_size=3)['deleted'] == 4
+    assert [row.value for row in manager.read_all('events')] == [4, 5]
+    changes, _ = manager.read_changed_since('events', watermark, safety_lag=0)
+    assert sorted(change.id for change in changes if change.deleted_at is not None) == ids[:4]
+    # уже помеченные записи повторно не считаются
+    assert manager.purge('events', {'value': ('<', 4)})['deleted'] == 0
+
+
+def test_soft_purge_hard_delete_removes_rows(manager):
+    make_events(manager, 'soft')
+    manager.delete('events', manager.read_all('events')[0].id)
+    assert manager.purge('events', {'value': ('<', 4)}, hard_delete=True)['deleted'] == 4
+    assert manager.aggregate('events', {'rows': ('count', '*')}) == {'rows': 2}
+
+
+def test_table_purge_updates_tombstone_of_reused_id(manager):
+    ids = make_events(manager, 'table', count=3)
+    manager.purge('events')
+    # SQLite выдает освободившиеся id заново, их tombstone уже есть в побочной таблице
+    assert manager.create_records('events', [{'name': 'again', 'value': 1}])[0] == ids[0]
+    assert manager.purge('events')['deleted'] == 1
+    changes, _ = manager.read_changed_since('events', safety_lag=0)
+    assert sorted(change.id for change in changes) == ids
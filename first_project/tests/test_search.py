@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import Integer, String, Text
+
+ARTICLES = {'title': String(100), 'body': Text, 'views': Integer}
+
+
+@pytest.fixture
+def articles(manager):
+    manager.create_model('articles', ARTICLES, tombstones='soft', searchable=['title', 'body'])
+    return manager
+
+
+def found(manager, query, **options):
+    return sorted(row.title for row in manager.search('articles', query, **options))
+
+
+def test_triggers_follow_insert_update_delete(articles):
+    first = articles.create_record('articles', {'title': 'postgres tuning', 'body': 'vacuum and indexes'}).id
+    articles.create_records('articles', [{'title': 'sqlite notes', 'body': 'fts5 and triggers'}])
+    assert found(articles, 'vacuum') == ['postgres tuning']
+    assert found(articles, 'triggers fts5') == ['sqlite notes']  # все слова запроса, в любом порядке
+    articles.update('articles', first, {'body': 'partitioning'})
+    assert found(articles, 'vacuum') == []
+    assert found(articles, 'partitioning', rank=False) == ['postgres tuning']
+    articles.purge('articles', {'id': first}, hard_delete=True)  # физическое удаление - триггер AFTER DELETE
+    assert found(articles, 'partitioning') == []
+
+
+def test_soft_deleted_rows_are_not_found(articles):
+    record_id = articles.create_record('articles', {'title': 'draft', 'body': 'hidden text'}).id
+    articles.delete('articles', record_id)
+    assert found(articles, 'hidden') == []
+
+
+def test_empty_query_and_special_characters(articles):
+    articles.create_records('articles', [{'title': 'mail', 'body': 'write to admin@example.com'},
+                                         {'title': 'version', 'body': 'released 2.0.1 today'}])
+    assert found(articles, '') == [] and found(articles, '   ') == []
+    assert found(articles, 'admin@example.com') == ['mail']
+    assert found(articles, '2.0.1') == ['version']
+    assert found(articles, 'say "hi" - ok') == []  # кавычки и минус не ломают синтаксис MATCH
+
+
+def test_table_without_searchable_columns(manager):
+    manager.create_model('plain', {'title': String(20)})
+    with pytest.raises(ValueError):
+        manager.search('plain', 'anything')
@@ -0,0 +1,126 @@
+import atexit
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import Integer, String
+
+from db_tools.alternative import _utcnow
+from db_tools.sharding import ShardedModelManager, shard_of_id
+
+ORDERS = {'user_id': Integer, 'city': String(20), 'amount': Integer}
+
+
+def make_orders(sharded, shard_key='user_id', users=12, per_user=5):
+    sharded.create_model('orders', ORDERS, shard_key=shard_key)
+    rows = [{'user_id': user, 'city': f'city{user % 3}', 'amount': user * 10 + n}
+            for user in range(users) for n in range(per_user)]
+    return rows, sharded.create_records('orders', rows)
+
+
+def test_rows_are_stored_on_the_shard_of_their_key(sharded):
+    rows, ids = make_orders(sharded)
+    for row, record_id in zip(rows, ids):
+        shard_index = sharded._shard_for_key('orders', row['user_id'])
+        assert shard_of_id(record_id) == shard_index
+        assert sharded.shards[shard_index].read('orders', record_id).user_id == row['user_id']
+
+
+def test_read_all_by_shard_key_reads_one_shard(sharded):
+    make_orders(sharded)
+    assert [row.user_id for row in sharded.read_all('orders', {'user_id': 7})] == [7] * 5
+    # значение другого типа маршрутизируется по типу столбца
+    assert len(sharded.read_all('orders', {'user_id': '7'})) == 5
+
+
+def test_read_all_merges_shards_in_id_order(sharded):
+    _, ids = make_orders(sharded)
+    assert [row.id for row in sharded.read_all('orders', compact=True)] == sorted(ids)
+
+
+def test_aggregates_match_unsharded_values(sharded):
+    rows, _ = make_orders(sharded)
+    amounts = [row['amount'] for row in rows]
+    result = sharded.aggregate('orders', {
+        'rows': ('count', '*'), 'total': ('sum', 'amount'), 'avg': ('avg', 'amount'),
+        'low': ('min', 'amount'), 'high': ('max', 'amount')})
+    assert result == {'rows': len(amounts), 'total': sum(amounts), 'avg': sum(amounts) / len(amounts),
+                      'low': min(amounts), 'high': max(amounts)}
+    assert sharded.aggregate('orders', {'rows': ('count', '*')}, {'amount': ('<', 0)}) == {'rows': 0}
+
+
+def test_run_concurrently_routes_tuple_ops(sharded):
+    rows, ids = make_orders(sharded, shard_key='id')
+    results = sharded.run_concurrently([('read', ('orders', record_id)) for record_id in ids])
+    assert [result.amount for result in results] == [row['amount'] for row in rows]
+
+
+def test_update_rejects_shard_key_change(sharded):
+    _, ids = make_orders(sharded)
+    with pytest.raises(ValueError):
+        sharded.update('orders', ids[0], {'user_id': 100})
+    row = sharded.read('orders', ids[0], compact=True)
+    with pytest.raises(ValueError):
+        sharded.update('orders', ids[0], row._replace(user_id=100))
+    # компактная строка с тем же ключом обновляется
+    sharded.update('orders', ids[0], row._replace(amount=-1))
+    assert sharded.read('orders', ids[0]).amount == -1
+
+
+def test_purge_resumes_from_each_shard_position(sharded):
+    rows, _ = make_orders(sharded, shard_key='id')
+    first = sharded.purge('orders', {'amount': ('<', 60)}, batch_size=3)
+    assert first['deleted'] == sum(row['amount'] < 60 for row in rows)
+    # каждый шард остановился на своем id
+    assert len({state['last_id'] for state in first['shards']}) == len(sharded.shards)
+    new_ids = sharded.create_records('orders', [{'user_id': 0, 'city': 'x', 'amount': 1}] * 6)
+    resumed = sharded.purge('orders', {'amount': ('<', 60)}, batch_size=3, start_after=first['shards'])
+    assert resumed['deleted'] == len(new_ids)
+    with pytest.raises(ValueError):
+        sharded.purge('orders', start_after=5)
+
+
+def test_node_ids_are_unique_and_released(shard_urls):
+    first = ShardedModelManager(shard_urls, node_lease=1)
+    other = ShardedModelManager(shard_urls, node_lease=1)
+    try:
+        assert other._ids.node_id != first._ids.node_id
+        # аренда first продлевается - запрошенный номер не освобождается и за срок аренды
+        with pytest.raises(ValueError):
+            ShardedModelManager(shard_urls, node_id=first._ids.node_id, node_lease=1)
+    finally:
+        other.close()
+    reused = ShardedModelManager(shard_urls, node_lease=1)
+    try:
+        assert reused._ids.node_id == other._ids.node_id
+    finally:
+        reused.close()
+        first.close()
+
+
+def test_expired_lease_is_reclaimed_from_any_host(shard_urls):
+    ShardedModelManager(shard_urls, node_lease=1).close()  # создает таблицу _id_nodes
+    probe = ShardedModelManager(shard_urls, node_lease=1)
+    with probe.shards[0].engine.begin() as connection:
+        connection.execute(probe._nodes.insert().values(
+            node_id=7, host='elsewhere', pid=1, claimed_at=_utcnow() - timedelta(seconds=5)))
+    probe.close()
+    reclaimed = ShardedModelManager(shard_urls, node_id=7, node_lease=1)
+    assert reclaimed._ids.node_id == 7
+    reclaimed.close()
+
+
+def test_restart_with_fixed_node_id_after_crash(shard_urls):
+    crashed = ShardedModelManager(shard_urls, node_id=3, node_lease=1)
+    crashed.create_model('orders', ORDERS, shard_key='user_id')
+    crashed._lease_stopped.set()  # процесс убит: аренда больше не продлевается, close() не вызван
+    crashed._lease_thread.join()
+    restarted = ShardedModelManager(shard_urls, node_id=3, node_lease=1)  # ждет истечения аренды
+    try:
+        assert restarted.create_record('orders', {'user_id': 1, 'city': 'a', 'amount': 1}).id
+        # прежний владелец, если он на самом деле жив, больше не выдает id с тем же node_id
+        with pytest.raises(RuntimeError):
+            crashed.create_record('orders', {'user_id': 1, 'city': 'a', 'amount': 2})
+    finally:
+        restarted.close()
+        atexit.unregister(crashed._release_node_id)
+        crashed._executor.shutdown()
@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import Integer, String
+
+from db_tools.alternative import AlternativeModelManager
+
+SALES = {'city': String(20), 'product': String(20), 'amount': Integer}
+AGGREGATES = {'orders': ('count', '*'), 'total': ('sum', 'amount'), 'avg': ('avg', 'amount'),
+              'priced': ('count', 'amount')}
+
+
+def rows_of(summary_rows):
+    return sorted(summary_rows, key=repr)
+
+
+def assert_matches_rebuild(manager, summary_table):
+    """Инкрементально поддержанная сводка совпадает с пересчитанной с нуля"""
+    maintained = rows_of(manager.read_summary(summary_table))
+    manager.rebuild_summary(summary_table)
+    assert maintained == rows_of(manager.read_summary(summary_table))
+    return maintained
+
+
+def fill(manager):
+    return manager.create_records('sales', [
+        {'city': city, 'product': product, 'amount': amount}
+        for amount, (city, product) in enumerate([('msk', 'tea'), ('msk', 'coffee'), ('spb', 'tea')] * 6)])
+
+
+@pytest.mark.parametrize('tombstones', [None, 'soft', 'table'])
+@pytest.mark.parametrize('group_by', [['city'], ['city', 'product'], []])
+def test_every_write_path_keeps_summary_consistent(manager, tombstones, group_by):
+    manager.create_model('sales', SALES, tombstones=tombstones)
+    ids = fill(manager)
+    summary = manager.create_summary('sales', group_by, AGGREGATES)
+    manager.create_record('sales', {'city': 'kzn', 'product': 'tea', 'amount': 5})
+    manager.create_records('sales', [{'city': 'msk', 'product': 'tea', 'amount': None},
+                                     {'city': 'kzn', 'product': 'cake'}])
+    assert_matches_rebuild(manager, summary)
+    manager.update('sales', ids[0], {'city': 'spb', 'amount': 100})
+    manager.update('sales', ids[1], {'product': 'milk'})
+    assert_matches_rebuild(manager, summary)
+    manager.delete('sales', ids[2])
+    assert_matches_rebuild(manager, summary)
+    manager.purge('sales', {'amount': ('<', 8)}, batch_size=4)
+    assert_matches_rebuild(manager, summary)
+    manager.purge('sales')
+    assert assert_matches_rebuild(manager, summary) == []
+
+
+def test_summary_values(manager):
+    manager.create_model('sales', SALES)
+    fill(manager)
+    summary = manager.create_summary('sales', ['city'], AGGREGATES)
+    by_city = {row['city']: row for row in manager.read_summary(summary)}
+    msk_amounts = [amount for amount in range(18) if amount % 3 != 2]
+    assert by_city['msk'] == {'city': 'msk', 'row_count': 12, 'orders': 12, 'total': sum(msk_amounts),
+                              'avg': sum(msk_amounts) / 12, 'priced': 12}
+    assert [row['city'] for row in manager.read_summary(summary, {'city': 'spb'})] == ['spb']
+
+
+def test_summary_created_later_is_maintained_immediately(manager):
+    manager.create_model('sales', SALES)
+    fill(manager)  # определения сводок уже закэшированы - пустым списком
+    summary = manager.create_summary('sales', [], {'orders': ('count', '*')})
+    manager.create_record('sales', {'city': 'msk', 'product': 'tea', 'amount': 1})
+    assert manager.read_summary(summary) == [{'row_count': 19, 'orders': 19}]
+
+
+def test_summary_created_by_another_manager_is_maintained(manager):
+    manager.create_model('sales', SALES)
+    manager.create_record('sales', {'city': 'msk', 'product': 'tea', 'amount': 1})
+    other = AlternativeModelManager(manager.database_url)  # другой процесс с той же БД
+    summary = other.create_summary('sales', ['city'], {'orders': ('count', '*')})
+    manager.create_record('sales', {'city': 'msk', 'product': 'tea', 'amount': 2})
+    assert manager.read_summary(summary) == [{'city': 'msk', 'row_count': 2, 'orders': 2}]
+    other.engine.dispose()
+
+
+def test_delete_table_drops_its_summaries(manager):
+    manager.create_model('sales', SALES)
+    summary = manager.create_summary('sales', ['city'], AGGREGATES)
+    manager.delete_table('sales')
+    assert not manager._table_exists(summary)
+    with pytest.raises(ValueError):
+        manager.read_summary(summary)
+
+
+def test_sharded_summary_merges_groups_of_all_shards(sharded):
+    sharded.create_model('sales', SALES)
+    ids = sharded.create_records('sales', [{'city': 'msk', 'product': 'tea', 'amount': amount} for amount in range(9)])
+    summary = sharded.create_summary('sales', ['city'], AGGREGATES)
+    sharded.delete('sales', ids[0])
+    assert sharded.read_summary(summary) == [{'city': 'msk', 'row_count': 8, 'orders': 8, 'total': 36,
+                                              'avg': 4.5, 'priced': 8}]
+    assert sharded.rebuild_summary(summary) == 1
+    assert sharded.read_summary(summary)[0]['total'] == 36